@@ -0,0 +1,236 @@
+# Framework overhead of the smithers interview graph.
+#
+# ChatOllama is swapped for a deterministic fake chat model with a fixed latency and a fixed number of tokens per answer, so whatever is left
+# of the time is LangGraph, the checkpointer and smithers itself. Four things are measured:
+#
+#   - graph overhead: wall time of every node run with a model that answers instantly, per node and per turn
+#   - checkpoint cost: the same turns with the in-memory checkpointer and with SQLite
+#   - state growth: size of the serialized state after every question
+#   - throughput: N concurrent sessions of M questions each driven through InterviewEngine, with the model's latency
+#
+# The exit code is 1 when the graph overhead per turn exceeds its budget.
+#
+#     python benchmarks/bench_graph.py --sessions 50 --questions 3 --latency 0.05
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+import smithers
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langgraph.types import Command
+
+# Graph overhead per turn, in seconds, with the in-memory checkpointer and an instant model.
+OVERHEAD_BUDGET = 0.02
+
+ANSWER = "I led the migration of our billing service to an event driven design, which cut the time to close an invoice from days to minutes."
+
+class FakeChatModel(BaseChatModel):
+    # Answers every prompt after `latency` seconds with `tokens` words, and reports the same counters as Ollama so that InterviewMetrics works
+    # unchanged. Questions are numbered, so no two in an interview are alike.
+    latency: float = 0.0
+    tokens: int = 20
+    counter: Any = None
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        
+        self.counter = itertools.count(1)
+    
+    @property
+    def _llm_type(self):
+        return "fake"
+    
+    def respond(self, messages):
+        text = " ".join([f"Question {next(self.counter)}:"] + ["token"] * (self.tokens - 2))
+        
+        prompt_tokens = sum(len(str(message.content).split()) for message in messages)
+        
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, response_metadata={
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": self.tokens,
+            "eval_duration": int(self.latency * 1e9),
+            "total_duration": int(self.latency * 1e9),
+            "load_duration": 0,
+        }))])
+    
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        
+        return self.respond(messages)
+    
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        
+        return self.respond(messages)
+    
+    def with_structured_output(self, schema, **kwargs):
+        # Every answer gets the same score and the judgement is always the same passing one, which keeps every run of the benchmark on the same
+        # path through the graph. The schema only takes the properties it has.
+        def judgement():
+            return schema.model_validate({"has_passed": "yes", "recommendation": " ".join(["token"] * self.tokens), "score": 80, "note": "token"})
+        
+        def judge(prompt):
+            time.sleep(self.latency)
+            
+            return judgement()
+        
+        async def ajudge(prompt):
+            await asyncio.sleep(self.latency)
+            
+            return judgement()
+        
+        return RunnableLambda(judge, afunc=ajudge)
+
+def read_resume():
+    return open(os.path.join(ROOT, "README.md"), encoding="utf-8").read()
+
+def run_session(app):
+    # Returns the wall time of every turn, the first question included.
+    thread_config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    
+    started_at = time.perf_counter()
+    
+    state = app.invoke(smithers.initial_state("Software Engineer", read_resume()), config=thread_config)
+    
+    turn_times = [time.perf_counter() - started_at]
+    
+    while not state["result"]:
+        started_at = time.perf_counter()
+        
+        state = app.invoke(Command(resume=ANSWER), config=thread_config)
+        
+        turn_times.append(time.perf_counter() - started_at)
+    
+    return turn_times
+
+def measure_graph_overhead(questions, repeat):
+    app = smithers.setup_app(FakeChatModel(), questions)
+    
+    metrics = smithers.InterviewMetrics()
+    
+    thread_config = {"configurable": {"thread_id": "overhead"}, "callbacks": [metrics.handler()]}
+    
+    state = app.invoke(smithers.initial_state("Software Engineer", read_resume()), config=thread_config)
+    
+    while not state["result"]:
+        state = app.invoke(Command(resume=ANSWER), config=thread_config)
+    
+    turn_times = min((run_session(app) for _ in range(repeat)), key=sum)
+    
+    return metrics.summary(), statistics.median(turn_times)
+
+def measure_checkpoint_cost(questions, repeat):
+    checkpoint_db = os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite")
+    
+    turn_times = {}
+    
+    for name, app in (("memory", smithers.setup_app(FakeChatModel(), questions)), ("sqlite", smithers.setup_app(FakeChatModel(), questions, checkpoint_db=checkpoint_db))):
+        turn_times[name] = statistics.median(min((run_session(app) for _ in range(repeat)), key=sum))
+    
+    return turn_times, os.path.getsize(checkpoint_db)
+
+def measure_state_growth(questions):
+    app = smithers.setup_app(FakeChatModel(), questions)
+    
+    thread_config = {"configurable": {"thread_id": "growth"}}
+    
+    state = app.invoke(smithers.initial_state("Software Engineer", read_resume()), config=thread_config)
+    
+    sizes = []
+    
+    while not state["result"]:
+        # The size the checkpointer writes for the whole state, resume included.
+        sizes.append((smithers.get_question_index(state), len(app.checkpointer.serde.dumps_typed(app.get_state(thread_config).values)[1])))
+        
+        state = app.invoke(Command(resume=ANSWER), config=thread_config)
+    
+    return sizes
+
+async def run_engine_session(engine):
+    thread_id = str(uuid.uuid4())
+    
+    turn_times = []
+    
+    started_at = time.perf_counter()
+    
+    state = await engine.start(thread_id, "Software Engineer", read_resume())
+    
+    turn_times.append(time.perf_counter() - started_at)
+    
+    while not state["result"]:
+        started_at = time.perf_counter()
+        
+        state = await engine.answer(thread_id, ANSWER)
+        
+        turn_times.append(time.perf_counter() - started_at)
+    
+    return turn_times
+
+async def measure_throughput(sessions, questions, latency, tokens, checkpoint_db):
+    app = smithers.setup_app(FakeChatModel(latency=latency, tokens=tokens), questions, checkpoint_db=checkpoint_db, asynchronous=True)
+    
+    engine = smithers.InterviewEngine(app)
+    
+    started_at = time.perf_counter()
+    
+    try:
+        turn_times = await asyncio.gather(*[run_engine_session(engine) for _ in range(sessions)])
+    finally:
+        await engine.close()
+    
+    return time.perf_counter() - started_at, sorted(itertools.chain.from_iterable(turn_times))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the framework overhead of the smithers interview graph with a fake chat model.")
+    parser.add_argument("--sessions", type=int, default=50, help="Number of concurrent sessions of the throughput run")
+    parser.add_argument("--questions", type=int, default=3, help="Maximum number of questions of every session, follow-ups excluded")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the fake model takes to answer in the throughput run")
+    parser.add_argument("--tokens", type=int, default=20, help="Number of tokens of every answer of the fake model")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the overhead and checkpoint measurements, the fastest one is kept")
+    args = parser.parse_args()
+    
+    node_metrics, overhead = measure_graph_overhead(args.questions, args.repeat)
+    
+    status = "ok" if overhead <= OVERHEAD_BUDGET else "OVER BUDGET"
+    
+    print(f"graph overhead: {overhead * 1000:.2f} ms per turn (budget {OVERHEAD_BUDGET * 1000:.0f} ms) [{status}]")
+    
+    for node, node_metric in node_metrics.items():
+        if node != "total":
+            print(f"    {node_metric['wall_time'] / node_metric['runs'] * 1000:8.2f} ms  {node} ({node_metric['runs']} runs)")
+    
+    checkpoint_times, checkpoint_db_size = measure_checkpoint_cost(args.questions, args.repeat)
+    
+    print(f"checkpoint cost: memory {checkpoint_times['memory'] * 1000:.2f} ms, sqlite {checkpoint_times['sqlite'] * 1000:.2f} ms per turn, "
+          f"{checkpoint_db_size / 1024:.0f} KiB on disk after {args.repeat} sessions")
+    
+    print("state growth:")
+    
+    for question_index, size in measure_state_growth(args.questions):
+        print(f"    {size / 1024:8.1f} KiB  after question {question_index}")
+    
+    for name, checkpoint_db in (("memory", None), ("sqlite", os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite"))):
+        wall_time, turn_times = asyncio.run(measure_throughput(args.sessions, args.questions, args.latency, args.tokens, checkpoint_db))
+        
+        print(f"throughput ({name}): {args.sessions} sessions x {args.questions} questions in {wall_time:.2f} s, {len(turn_times) / wall_time:.0f} turns/s, "
+              f"turn p50 {turn_times[len(turn_times) // 2] * 1000:.0f} ms, p95 {turn_times[int(len(turn_times) * 0.95)] * 1000:.0f} ms")
+    
+    sys.exit(1 if overhead > OVERHEAD_BUDGET else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Startup budget of the smithers CLI.
+#
+# Every scenario runs in a fresh interpreter under `python -X importtime`. The best of a few runs is compared against the scenario's budget,
+# and the slowest top level imports are listed so a regression points at its culprit. The exit code is 1 when a budget is exceeded.
+#
+#     python benchmarks/bench_startup.py
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The welcome banner is reached through the interview command. The work it overlaps with runs on background threads, which would race with
+# the measurement, so it is stubbed out and the process exits as soon as the banner is shown.
+BANNER = """
+import os, sys, smithers
+smithers.warm_up_models = smithers.setup_doc_loader = smithers.setup_llm = smithers.setup_app = lambda *args, **kwargs: None
+introduce_interview = smithers.introduce_interview
+smithers.introduce_interview = lambda role: (introduce_interview(role), os._exit(0))
+smithers.cli.main([sys.argv[1], '--role', 'Software Engineer'])
+"""
+
+# Name: (code run in the fresh interpreter, import time budget in seconds)
+SCENARIOS = {
+    "help": ("import smithers; smithers.cli.main(['--help'], standalone_mode=False)", 0.15),
+    "rejected file": ("import smithers; smithers.cli.main(['README.md', '--role', 'Software Engineer'], standalone_mode=False)", 0.15),
+    "banner": (BANNER, 0.15),
+}
+
+def parse_importtime(stderr):
+    # Lines look like `import time:   self [us] | cumulative | package`, and every level of nesting indents the package by two more spaces.
+    imports = []
+    
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        
+        _, cumulative, package = line.split("|")
+        
+        depth = (len(package) - len(package.lstrip()) - 1) // 2
+        
+        imports.append((depth, int(cumulative) / 1_000_000, package.strip()))
+    
+    return imports
+
+def run_scenario(code, resume_path):
+    started_at = time.perf_counter()
+    
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code, resume_path], cwd=ROOT, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    
+    wall_time = time.perf_counter() - started_at
+    
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr)
+    
+    return wall_time, parse_importtime(process.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the startup time of the smithers CLI against its budget.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario, the fastest one is kept")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest top level imports listed per scenario")
+    args = parser.parse_args()
+    
+    over_budget = False
+    
+    # The interview command only checks that the resume exists and has a supported extension before showing the banner.
+    resume_path = os.path.join(tempfile.mkdtemp(), "resume.pdf")
+    
+    open(resume_path, "wb").close()
+    
+    for name, (code, budget) in SCENARIOS.items():
+        wall_time, imports = min((run_scenario(code, resume_path) for _ in range(args.repeat)), key=lambda run: run[0])
+        
+        import_time = sum(cumulative for depth, cumulative, _ in imports if depth == 0)
+        
+        status = "ok" if import_time <= budget else "OVER BUDGET"
+        over_budget = over_budget or import_time > budget
+        
+        print(f"{name}: imports {import_time * 1000:.0f} ms (budget {budget * 1000:.0f} ms), wall {wall_time * 1000:.0f} ms [{status}]")
+        
+        # The modules imported by smithers and by the interpreter's own startup, which is where a new heavy import shows up.
+        direct_imports = sorted(((cumulative, package) for depth, cumulative, package in imports if depth == 1), reverse=True)
+        
+        for cumulative, package in direct_imports[:args.top]:
+            print(f"    {cumulative * 1000:8.1f} ms  {package}")
+    
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == "__main__":
+    main()
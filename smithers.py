@@ -1,57 +1,208 @@
 import click
 from dotenv import load_dotenv
-from langchain_ollama import ChatOllama
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_core.prompts import PromptTemplate
-from langchain_core.documents import Document
-from typing import List, Optional, TypedDict
-from langgraph.graph import START, StateGraph
-from langgraph.types import interrupt, Command
-from langgraph.checkpoint.memory import MemorySaver
-from httpx import ConnectError
+from typing import Annotated, List, Literal, Optional, TypedDict
 import uuid
-from halo import Halo
+import collections
+import shutil
+import tempfile
+import os
+import sqlite3
+import hashlib
+import json
+import time
+import zipfile
+import itertools
+import re
+import threading
+import functools
+import contextlib
+import operator
+import random
+import importlib.util
+import tomllib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from xml.etree import ElementTree
 
-from pydantic import BaseModel, Field
+# LangChain, LangGraph, pydantic, httpx, aiohttp and halo take a while to import, and neither `smithers --help` nor a rejected resume file
+# needs them. They are imported by the functions that use them instead of at the top of the module.
+# benchmarks/bench_startup.py guards the resulting startup budget.
+
+# Ollama reloads the model whenever num_ctx changes between requests, which also throws away its prompt cache, and its default window is small
+# enough to silently cut long prompts. Every model is given the smallest of these windows that fits its prompts so far, which only ever grows, so
+# the model is reloaded at most once per window. Prompts that don't fit in the largest one lose their oldest turns.
+CONTEXT_WINDOWS = (2048, 4096, 8192)
+
+# Tokens of the window kept for the answer.
+RESPONSE_TOKENS = 512
+
+# Characters per token of the prompts until Ollama's token counts calibrate it, about right for English text and Llama's tokenizer, and the tokens
+# the chat template adds around every message.
+CHARS_PER_TOKEN = 4.0
+MESSAGE_TOKENS = 4
+
+MAX_FOLLOWUPS = 1
+
+# Prompts carry the latest turns of the interview, a turn being a question and its answer, and a summary of the ones before. Once more than twice
+# RECENT_TURNS turns are left out of the summary, the oldest RECENT_TURNS of them are folded into it, so a prompt holds about twice RECENT_TURNS
+# turns whatever the number of questions, and the summary only changes every RECENT_TURNS turns. The summary is written in the background and
+# questions don't wait for it, so a candidate answering faster than it is written gets a few more turns in the prompt meanwhile.
+RECENT_TURNS = 4
+
+# Ollama, or any server exposing the OpenAI chat completions API, such as llama.cpp's server or vLLM.
+MODEL_BACKENDS = ("ollama", "openai")
+DEFAULT_MODEL = "llama3.1"
+DEFAULT_OPENAI_BASE_URL = "http://localhost:8080/v1"
+
+# Nodes that call the model, each of which can be given its own.
+MODEL_NODES = ("handle_next_question", "handle_followup_question", "judge_candidate")
+
+# Every node and session of a process shares one pool of keep-alive connections to the model server. Idle connections are kept well past an
+# answer's thinking time, so a turn never waits on a new connection.
+MODEL_CONNECTIONS = 32
+MODEL_KEEPALIVE_EXPIRY = 300
+
+# Every try of a model call fails once it has taken this many seconds, see setup_model_policy. Failures that may not happen again are retried
+# after a jittered exponential backoff, in seconds.
+DEFAULT_MODEL_TIMEOUT = 300
+DEFAULT_MODEL_RETRIES = 2
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 8
+# Rate limited, or the server is overloaded or restarting.
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+# Seconds the model has to answer before the call goes to the fallback model, when there is one.
+DEFAULT_LATENCY_SLO = 20
+
+# With several model servers, endpoints that failed are probed this often, in seconds, and take requests again once they answer.
+HEALTH_CHECK_INTERVAL = 10
+# Number of interviews whose endpoint is remembered, the least recently routed ones are forgotten first.
+MAX_STICKY_SESSIONS = 10000
+
+DEFAULT_CHECKPOINT_DB = os.path.join(os.path.expanduser("~"), ".smithers", "checkpoints.sqlite")
+
+# The server forgets what it holds in memory for an interview that hasn't been answered for this many seconds, checking every
+# SESSION_EVICTION_INTERVAL seconds. The interview itself stays in the checkpointer and can still be answered.
+SESSION_IDLE_TIME = 30 * 60
+SESSION_EVICTION_INTERVAL = 60
+
+# Parsed resumes are cached by the SHA-256 of the file, so retaking an interview with the same resume skips parsing it.
+RESUME_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".smithers", "resumes")
+RESUME_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESUME_CACHE_VERSION = 3
+
+# A resume is split once into its entries, such as a job, a project, a degree or a list of skills, and every new subject of the interview is
+# about the entry asked about the least. Lines matching these headings start a section, and so do short lines in capitals without
+# punctuation that have content under them, once a section has started.
+RESUME_SECTIONS = (
+    "summary", "profile", "experience", "work experience", "professional experience", "employment", "projects", "education", "skills",
+    "technical skills", "certifications", "publications", "awards", "volunteering", "languages", "interests",
+)
+
+# Entries shorter than this are merged into the entry before them in the same section, and longer ones are split between lines.
+MIN_ENTRY_CHARS = 80
+MAX_ENTRY_CHARS = 1500
+
+# Share of a speculative question's words found in the candidate's answer above which the question is considered already answered.
+SPECULATION_OVERLAP = 0.5
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
 
 def main():
     load_dotenv()
     
-    interview()
+    cli()
 
 def setup_prompt_templates():
-    template_next_question = PromptTemplate.from_template("""
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    
+    # Every prompt starts with the exact same messages and the interview only grows at its end, so consecutive prompts share everything up to the
+    # latest answer. Ollama keeps the KV cache of the previous prompt and only prefills what comes after the longest common prefix.
+    # Folding the oldest turns into the summary is the exception, which is why it only happens every RECENT_TURNS turns.
+    # Node specific instructions must therefore go last.
+    system_prefix = ("system", """
         You are an interviewer for the following role: {role}.
-        This is the candidate's resume: {resume}.
-        This is the interview so far: {history}.
-        Ask your next question, based on a different entry of the candidate's resume.
-        Don't repeat your questions.
-        Output just the question and no extra text.
     """)
+    
+    template_next_question = ChatPromptTemplate.from_messages([
+        system_prefix,
+        MessagesPlaceholder("history"),
+        ("human", """
+            Ask your next question, based on this entry of the candidate's resume: {entry}
+            Don't repeat your questions.
+            Output just the question and no extra text.
+        """)
+    ])
 
-    template_followup_question = PromptTemplate.from_template("""
-        You are an interviewer for the following role: {role}.
-        This is the candidate's resume: {resume}.
-        This is the interview so far: {history}.
-        Ask a follow-up question based on the recent history around the current subject, which is the following: {question_history}.
-        Don't repeat your questions.
-        Output just the question and no extra text.
-    """)
+    template_followup_question = ChatPromptTemplate.from_messages([
+        system_prefix,
+        MessagesPlaceholder("history"),
+        ("human", """
+            Ask a follow-up question based on the recent history around the current subject, which started with your question: {subject}
+            The subject is about this entry of the candidate's resume: {entry}
+            Don't repeat your questions.
+            Output just the question and no extra text.
+        """)
+    ])
 
-    template_judgement = PromptTemplate.from_template("""
-        You are an interviewer for the following role: {role}.
-        This is the interview so far: {history}.
-        Based on the candidate's answers, extract the properties mentioned in the 'Judgement' class.
-    """)
+    # Every answer is scored on its own as soon as it's given, and the judgement only reads the scores and their notes instead of the transcript.
+    template_answer_score = ChatPromptTemplate.from_messages([
+        system_prefix,
+        ("human", """
+            You asked the candidate: {question}
+            They answered: {answer}
+            Score this answer on its own.
+            Answer with a JSON object with these properties:
+            {properties}
+        """)
+    ])
+
+    template_judgement = ChatPromptTemplate.from_messages([
+        system_prefix,
+        ("human", """
+            These are your notes on the candidate's answers, each scored out of 100:
+            {notes}
+            Based on them, judge the candidate for the role.
+            Answer with a JSON object with these properties:
+            {properties}
+        """)
+    ])
     
-    return template_next_question, template_followup_question, template_judgement
+    # The summary is written by a call of its own, outside of the interview's prompts, so it has no use for their prefix.
+    template_summary = ChatPromptTemplate.from_messages([
+        ("system", """
+            You keep the notes of a job interview for the following role: {role}.
+        """),
+        ("human", """
+            These are your notes of the interview so far: {summary}
+            This is how the interview went on:
+            {transcript}
+            Rewrite your notes to include it. Keep every subject asked about, and what the candidate's answers showed about their skills and
+            experience, including the specific facts and examples they gave.
+            Output just the notes and no extra text.
+        """)
+    ])
+    
+    return template_next_question, template_followup_question, template_answer_score, template_judgement, template_summary
 
 def setup_state():
+    from langchain_core.documents import Document
+    from langchain_core.messages import AnyMessage
+    from langgraph.graph import StateGraph
+    from langgraph.graph.message import add_messages
+    
+    # The interviewer's questions are AI messages and the candidate's answers are human messages. Nodes only return the message they add and the
+    # reducer appends it, instead of every node rebuilding the whole transcript.
+    #
+    # A resume entry is added to the covered ones every time a new subject starts, so the latest one is the entry of the current subject.
     class State(TypedDict):
+        role: str
         context: List[Document]
+        entries: List[str]
+        covered_entries: Annotated[List[int], operator.add]
         question: Optional[str] = None
-        question_history: Optional[str] = None
-        history: Optional[str] = None
+        history: Annotated[List[AnyMessage], add_messages]
+        topic_start: Optional[int] = None
+        summary: Optional[str] = None
+        summarized: Optional[int] = None
         total_followups: Optional[int] = None
         total_questions: Optional[int] = None
         result: Optional[str] = None
@@ -60,111 +211,2195 @@ def setup_state():
     
     workflow = StateGraph(State)
     
-    return workflow
-
-def setup_doc_loader(file_path):
-    loader = PyPDFLoader(file_path)
-
-    loaded_docs = loader.load()
-
-    docs_content = ""
+    return workflow
+
+def setup_doc_loader(file_path, cache_dir=None, workers=1, max_pages=None):
+    if cache_dir:
+        with open(file_path, "rb") as file:
+            digest = hashlib.file_digest(file, "sha256").hexdigest()
+        
+        cached_resume = load_cached_resume(cache_dir, digest)
+        
+        # An entry read with a page cap serves the requests with the same cap or a lower one, and any request once it holds every page.
+        if cached_resume and (cached_resume.get("max_pages") is None or (max_pages is not None and max_pages <= cached_resume["max_pages"])):
+            return cached_resume["content"]
+    
+    if file_path.endswith(".docx"):
+        docs_content, metadata = extract_docx_text(file_path)
+    else:
+        docs_content, metadata = extract_pdf_text(file_path, workers, max_pages)
+    
+    if cache_dir:
+        # The cap only matters when it stopped the reading, which never happens to a DOCX file.
+        save_cached_resume(cache_dir, digest, {
+            "version": RESUME_CACHE_VERSION,
+            "max_pages": max_pages if max_pages is not None and metadata.get("pages", 0) >= max_pages else None,
+            "content": docs_content,
+            "metadata": {
+                "source": os.path.basename(file_path),
+                "size": os.path.getsize(file_path),
+                "parsed_at": time.time(),
+                **metadata
+            }
+        })
+    
+    return docs_content
+
+def extract_pdf_text(file_path, workers=1, max_pages=None):
+    from langchain_community.document_loaders import PyPDFLoader
+    from pypdf import PdfReader
+    
+    if workers <= 1:
+        loader = PyPDFLoader(file_path)
+
+        loaded_docs = list(itertools.islice(loader.lazy_load(), max_pages))
+
+        return "\n".join(doc.page_content for doc in loaded_docs), {"pages": len(loaded_docs)}
+    
+    total_pages = len(PdfReader(file_path).pages)
+    
+    if max_pages is not None:
+        total_pages = min(total_pages, max_pages)
+    
+    # Each worker opens the file once and extracts a contiguous range of pages. Page extraction is CPU bound pure Python, hence processes and not
+    # threads. Executor.map yields the ranges in the order they were submitted, which keeps the pages in order.
+    pages_per_worker = -(-total_pages // workers)
+    
+    starts = range(0, total_pages, pages_per_worker)
+    stops = [min(start + pages_per_worker, total_pages) for start in starts]
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        page_ranges = executor.map(extract_pdf_pages, itertools.repeat(file_path), starts, stops)
+        
+        docs_content = "\n".join(itertools.chain.from_iterable(page_ranges))
+    
+    return docs_content, {"pages": total_pages}
+
+def extract_pdf_pages(file_path, start, stop):
+    from pypdf import PdfReader
+    
+    reader = PdfReader(file_path)
+    
+    return [reader.pages[index].extract_text().strip() for index in range(start, stop)]
+
+def extract_docx_text(file_path):
+    # A DOCX file is a zip whose text lives in word/document.xml. It is read straight from the zip with iterparse, clearing every paragraph once
+    # its text is collected, so neither the embedded images nor the full XML tree are ever held in memory.
+    # https://learn.microsoft.com/en-us/office/open-xml/word/working-with-paragraphs
+    paragraphs = []
+    runs = []
+    
+    with zipfile.ZipFile(file_path) as docx, docx.open("word/document.xml") as document:
+        for _, element in ElementTree.iterparse(document):
+            if element.tag == f"{WORD_NAMESPACE}t":
+                runs.append(element.text or "")
+            
+            elif element.tag == f"{WORD_NAMESPACE}tab":
+                runs.append("\t")
+            
+            elif element.tag in (f"{WORD_NAMESPACE}br", f"{WORD_NAMESPACE}cr"):
+                runs.append("\n")
+            
+            elif element.tag == f"{WORD_NAMESPACE}p":
+                paragraphs.append("".join(runs))
+                
+                runs = []
+                
+                element.clear()
+            
+            elif element.tag == f"{WORD_NAMESPACE}tbl":
+                element.clear()
+    
+    return "\n".join(paragraphs), {"paragraphs": len(paragraphs)}
+
+def is_section_heading(line, next_line=None, in_sections=False):
+    # Lines in capitals are also names, company names such as "ACME, INC." and the last line of a page. Above the first known section, they are
+    # the candidate's name at the top of the resume.
+    words = line.rstrip(":").split()
+    
+    if " ".join(words).lower() in RESUME_SECTIONS:
+        return True
+    
+    return in_sections and line.isupper() and len(words) <= 4 and not re.search(r"[^\w\s&/]", line.rstrip(":")) and bool(next_line) and not next_line.isupper()
+
+def is_bullet(line):
+    return line[:1] in "-*•◦▪●·" or line[:2] == "o "
+
+def segment_resume(docs_content):
+    # Splits the resume's text into its entries, each one starting with the heading of its section. PDF and DOCX text has a line per paragraph,
+    # so an entry ends at a blank line, at a heading, or where a line that isn't a bullet follows bullets, like the title of the next job after
+    # the achievements of the previous one. What comes before the first heading is kept only when it's long enough to ask about, which skips the
+    # candidate's name and contact details but not a summary.
+    entries = []
+    sections = []
+    section = None
+    lines = []
+    
+    def flush():
+        text = "\n".join(lines)
+        
+        lines.clear()
+        
+        if not text:
+            return
+        
+        if len(text) < MIN_ENTRY_CHARS and sections and sections[-1] == section:
+            entries[-1] += "\n" + text
+        
+        elif len(text) >= MIN_ENTRY_CHARS or section:
+            entries.append(f"{section}\n{text}" if section else text)
+            sections.append(section)
+    
+    content_lines = [line.strip() for line in docs_content.splitlines()]
+    
+    for index, line in enumerate(content_lines):
+        if not line:
+            flush()
+        
+        elif is_section_heading(line, next((following for following in content_lines[index + 1:] if following), None), section is not None):
+            flush()
+            
+            section = line.rstrip(":")
+        
+        else:
+            if lines and is_bullet(lines[-1]) and not is_bullet(line):
+                flush()
+            
+            lines.append(line)
+    
+    flush()
+    
+    # Entries too long for one subject, such as a whole resume without headings, are split between lines.
+    split_entries = []
+    
+    for entry in entries:
+        chunk = ""
+        
+        for line in entry.splitlines():
+            if chunk and len(chunk) + len(line) >= MAX_ENTRY_CHARS:
+                split_entries.append(chunk)
+                
+                chunk = ""
+            
+            chunk = f"{chunk}\n{line}" if chunk else line
+        
+        split_entries.append(chunk)
+    
+    return split_entries or [docs_content.strip()]
+
+def next_resume_entry(state):
+    # The entry asked about the least, the earliest in the resume first. Every entry is covered once before any of them comes back.
+    entries = resume_entries(state)
+    covered_entries = state.get("covered_entries") or []
+    
+    return min(range(len(entries)), key=lambda index: (covered_entries.count(index), index))
+
+def current_resume_entry(state):
+    covered_entries = state.get("covered_entries") or [0]
+    
+    return resume_entries(state)[covered_entries[-1]]
+
+def resume_entries(state):
+    # Interviews saved before resumes were split into entries only have the whole text.
+    return state.get("entries") or [state["context"]]
+
+
+def load_cached_resume(cache_dir, digest):
+    cache_path = os.path.join(cache_dir, f"{digest}.json")
+    
+    try:
+        with open(cache_path, encoding="utf-8") as file:
+            cached_resume = json.load(file)
+    except (OSError, ValueError):
+        return None
+    
+    # Entries written by an older extractor are parsed again.
+    if cached_resume.get("version") != RESUME_CACHE_VERSION:
+        return None
+    
+    # The modification time doubles as the last access time for the LRU eviction.
+    os.utime(cache_path)
+    
+    return cached_resume
+
+def save_cached_resume(cache_dir, digest, cached_resume):
+    os.makedirs(cache_dir, exist_ok=True)
+    
+    cache_path = os.path.join(cache_dir, f"{digest}.json")
+    
+    # Written to a temporary file first so a concurrent run never reads half an entry. Sessions of the batch and serve commands parse resumes on
+    # several threads of the same process, so the thread is part of the name too.
+    temporary_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(cached_resume, file)
+    
+    os.replace(temporary_path, cache_path)
+    
+    evict_cached_resumes(cache_dir, RESUME_CACHE_MAX_BYTES)
+
+def evict_cached_resumes(cache_dir, max_bytes):
+    entries = []
+    
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".json"):
+            stat = entry.stat()
+            
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    
+    total_bytes = sum(size for _, size, _ in entries)
+    
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        
+        total_bytes -= size
+
+class BackgroundTasks:
+    # Work started by a node and picked up by a later node of the same interview. Tasks are keyed by thread id so that sessions sharing the
+    # graph never see each other's work. They run outside of the graph's context, so their model calls are not streamed to the candidate.
+    # When the graph is run through its async API, they are asyncio tasks on its event loop. Otherwise they go to a pool of threads, as many
+    # as there are connections to the model server, which is what they wait on.
+    def __init__(self, max_workers=MODEL_CONNECTIONS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smithers")
+        self.tasks = {}
+        self.lock = threading.Lock()
+    
+    def submit(self, thread_id, key, function, coroutine_function, *args):
+        import asyncio
+        import contextvars
+        
+        with self.lock:
+            if (thread_id, key) in self.tasks:
+                return
+            
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.tasks[(thread_id, key)] = self.executor.submit(function, *args)
+            else:
+                # A task copies the context it is created in, which holds the node's callbacks. It starts from an empty one instead.
+                self.tasks[(thread_id, key)] = loop.create_task(coroutine_function(*args), context=contextvars.Context())
+    
+    def pop(self, thread_id, key):
+        with self.lock:
+            return self.tasks.pop((thread_id, key), None)
+    
+    def pop_done(self, thread_id, key):
+        # The task only once it's over, left running otherwise.
+        with self.lock:
+            if (thread_id, key) in self.tasks and self.tasks[(thread_id, key)].done():
+                return self.tasks.pop((thread_id, key))
+            
+            return None
+    
+    def discard(self, thread_id):
+        with self.lock:
+            for task_key in [task_key for task_key in self.tasks if task_key[0] == thread_id]:
+                self.tasks.pop(task_key).cancel()
+    
+    def clear(self):
+        with self.lock:
+            for task in self.tasks.values():
+                task.cancel()
+            
+            self.tasks.clear()
+
+def background_config(config):
+    # The config of a model call a node makes in the background: the node's metadata, for the call to be routed to the interview's server and
+    # recorded under the node, and the session's metrics and tracing handlers. LangGraph's own handler is left out, since it would stream the
+    # call's tokens to the candidate.
+    from langchain_core.callbacks import BaseCallbackManager
+    from langgraph.pregel.messages import StreamMessagesHandler
+    
+    callbacks = config.get("callbacks")
+    handlers = callbacks.handlers if isinstance(callbacks, BaseCallbackManager) else callbacks or []
+    
+    return {
+        "metadata": {**config.get("metadata", {}), "thread_id": config["configurable"]["thread_id"]},
+        "callbacks": [handler for handler in handlers if not isinstance(handler, StreamMessagesHandler)]
+    }
+
+def content_words(text):
+    return {word for word in re.findall(r"[a-z0-9+#]+", text.lower()) if len(word) > 3}
+
+def is_answered_by(question, answer):
+    # A speculative question is written before the answer it follows. If the answer already covers most of what it asks, asking it would be a repeat.
+    question_words = content_words(question)
+    
+    return bool(question_words) and len(question_words & content_words(answer)) / len(question_words) >= SPECULATION_OVERLAP
+
+def setup_graph_nodes(llm, workflow, template_next_question, template_followup_question, template_answer_score, template_judgement, template_summary, max_questions, max_followups, speculate=False, node_llms=None):
+    import asyncio
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.types import interrupt
+    from pydantic import BaseModel, Field
+    
+    background_tasks = BackgroundTasks()
+    
+    # Follow-ups are short and can do with a smaller, faster model than the judgement, see MODEL_NODES. Each model keeps its own prompt cache.
+    node_llms = node_llms or {}
+    
+    next_question_llm = node_llms.get("handle_next_question", llm)
+    followup_question_llm = node_llms.get("handle_followup_question", llm)
+    # The answers are scored by the judgement's model.
+    judgement_llm = node_llms.get("judge_candidate", llm)
+    
+    # Summarizing is no harder than a follow-up, so it goes to the follow-ups' model.
+    summary_llm = followup_question_llm
+    
+    # Every node that calls the model comes in a sync and an async flavor. app.invoke runs the former and app.ainvoke the latter, which awaits
+    # ChatOllama's async client instead of blocking a thread per interview.
+    #
+    # The scores and the judgement are JSON objects the model server constrains the output to, see structured_output. The model doesn't see the
+    # schemas as tools, so their properties are spelled out in the prompts. The candidate's score is the average of their answers' scores.
+    class AnswerScore(BaseModel):
+        score: int = Field(ge=0, le=100, description="The score of the answer, 0 out of 100, for how well it shows what the role needs with specific and correct details.")
+        note: str = Field(description="One sentence on what the answer showed about the candidate.")
+    
+    class Judgement(BaseModel):
+        has_passed: Literal["yes", "no"] = Field(description="Whether the candidate is recommended for the role. The possible values are 'yes' or 'no'.")
+        recommendation: str = Field(description="""
+            Provide a recommendation based on the candidate's answers.
+            Talk about competences such as technical knowledge, problem-solving skills, communication skills, initiative, adaptability, and teamwork.
+            You don't need to mention all of them, mention the ones that are suitable for the questions asked.
+        """) # https://www.reddit.com/r/LocalLLaMA/comments/1hcj0ur/structured_outputs_can_hurt_the_performance_of/
+    
+    def schema_properties(schema):
+        return "\n".join(f"{name}: {" ".join(field.description.split())}" for name, field in schema.model_fields.items())
+    
+    def model_output(output):
+        # Chat models that support structured output themselves give the schema's object, and structured_output gives the parsed JSON.
+        return output.model_dump() if isinstance(output, BaseModel) else output
+    
+    def summary_prompt(role, summary, messages):
+        transcript = "\n".join(f"{"Interviewer" if message.type == "ai" else "Candidate"}: {message.content}" for message in messages)
+        
+        return template_summary.invoke({"role": role, "summary": summary or "nothing yet.", "transcript": transcript})
+    
+    def summarize_history(role, summary, messages, config=None):
+        return summary_llm.invoke(summary_prompt(role, summary, messages), config).content
+    
+    async def asummarize_history(role, summary, messages, config=None):
+        return (await summary_llm.ainvoke(summary_prompt(role, summary, messages), config)).content
+
+    def submit_summary(state, config):
+        # Folds the oldest turns left out of the summary into it while the candidate is typing.
+        summarized = state.get("summarized") or 0
+        
+        if len(state["history"]) - summarized <= 4 * RECENT_TURNS:
+            return
+        
+        messages = state["history"][summarized:summarized + 2 * RECENT_TURNS]
+        
+        background_tasks.submit(config["configurable"]["thread_id"], ("summary", summarized), summarize_history, asummarize_history, state["role"], state.get("summary"), messages, background_config(config))
+
+    def take_summary(state, config):
+        # Returns the summary and the number of messages it covers, the new ones once the background summary is written. The question is never
+        # held up by the summary: until it's written, or if it failed, the turns it would have covered stay in the prompt as they are. A summary
+        # still being written is picked up by a later question.
+        summarized = state.get("summarized") or 0
+        
+        task = background_tasks.pop_done(config["configurable"]["thread_id"], ("summary", summarized))
+        
+        if task:
+            try:
+                return task.result(), summarized + 2 * RECENT_TURNS
+            except Exception:
+                pass
+        
+        return state.get("summary"), summarized
+
+    def context_messages(state, summary, summarized):
+        # The messages standing in for the history in every prompt: the summary of the oldest turns followed by the latest ones.
+        if not summary:
+            return state["history"]
+        
+        return [SystemMessage(content=f"Summary of the interview so far: {summary}"), *state["history"][summarized:]]
+
+    def answer_score_prompt(role, question, answer):
+        return template_answer_score.invoke({"role": role, "question": question, "answer": answer, "properties": schema_properties(AnswerScore)})
+    
+    def answer_score_result(question, answer_score):
+        answer_score = model_output(answer_score)
+        
+        return question, read_score(answer_score.get("score")), answer_score.get("note")
+    
+    def score_answer(role, question, answer, config=None):
+        return answer_score_result(question, structured_output(judgement_llm, AnswerScore).invoke(answer_score_prompt(role, question, answer), config))
+    
+    async def ascore_answer(role, question, answer, config=None):
+        return answer_score_result(question, await structured_output(judgement_llm, AnswerScore).ainvoke(answer_score_prompt(role, question, answer), config))
+    
+    def submit_answer_scores(state, config):
+        # Scores every answer of the history in the background, where the judgement picks them up. Answers already being scored are skipped.
+        # Returns the indexes of the answers in the history.
+        indexes = [index for index, message in enumerate(state["history"]) if message.type == "human"]
+        
+        for index in indexes:
+            background_tasks.submit(config["configurable"]["thread_id"], ("answer_score", index), score_answer, ascore_answer, state["role"], state["history"][index - 1].content, state["history"][index].content, background_config(config))
+        
+        return indexes
+    
+    def answer_scores(results):
+        # Scores that failed or can't be read are left out.
+        return [result for result in results if not isinstance(result, BaseException) and result[1] is not None]
+    
+    def take_answer_scores(state, config):
+        # The scores of all the answers. Answers without one, such as those given before the interview was resumed by another process, are scored
+        # now, all at once.
+        thread_id = config["configurable"]["thread_id"]
+        
+        results = []
+        
+        for index in submit_answer_scores(state, config):
+            try:
+                results.append(background_tasks.pop(thread_id, ("answer_score", index)).result())
+            except Exception:
+                continue
+        
+        return answer_scores(results)
+    
+    async def atake_answer_scores(state, config):
+        thread_id = config["configurable"]["thread_id"]
+        
+        tasks = [background_tasks.pop(thread_id, ("answer_score", index)) for index in submit_answer_scores(state, config)]
+        
+        return answer_scores(await asyncio.gather(*tasks, return_exceptions=True))
+    
+    def ask_next_question(role, entry, history, config=None):
+        prompt = template_next_question.invoke({"role": role, "entry": entry, "history": history})
+        
+        question = next_question_llm.invoke(prompt, config)
+        
+        return question.content
+    
+    async def aask_next_question(role, entry, history, config=None):
+        prompt = template_next_question.invoke({"role": role, "entry": entry, "history": history})
+        
+        question = await next_question_llm.ainvoke(prompt, config)
+        
+        return question.content
+    
+    def speculative_question(state, question):
+        # The speculation was based on the history right before the answer that was just given.
+        if is_answered_by(question, state["history"][-1].content):
+            return None
+        
+        return question
+    
+    def take_speculative_question(state, config):
+        speculation = background_tasks.pop(config["configurable"]["thread_id"], ("next_question", len(state["history"]) - 1))
+        
+        if not speculation:
+            return None
+        
+        try:
+            return speculative_question(state, speculation.result())
+        except Exception:
+            return None
+    
+    async def atake_speculative_question(state, config):
+        speculation = background_tasks.pop(config["configurable"]["thread_id"], ("next_question", len(state["history"]) - 1))
+        
+        if not speculation:
+            return None
+        
+        try:
+            return speculative_question(state, await speculation)
+        except Exception:
+            return None
+    
+    def next_question_update(state, entry_index, question, summary, summarized):
+        return {
+            "question": question,
+            "total_questions": state["total_questions"] + 1,
+            "total_followups": 0,
+            "history": [AIMessage(content=question)],
+            "topic_start": len(state["history"]),
+            "covered_entries": [entry_index],
+            "summary": summary,
+            "summarized": summarized
+        }
+
+    def handle_next_question(state, config):
+        # A speculative question was written about the same entry, since the covered entries don't change while the candidate answers.
+        entry_index = next_resume_entry(state)
+        
+        summary, summarized = take_summary(state, config)
+        
+        question = take_speculative_question(state, config) if speculate else None
+        
+        if not question:
+            question = ask_next_question(state["role"], resume_entries(state)[entry_index], context_messages(state, summary, summarized))
+        
+        return next_question_update(state, entry_index, question, summary, summarized)
+
+    async def ahandle_next_question(state, config):
+        entry_index = next_resume_entry(state)
+        
+        summary, summarized = take_summary(state, config)
+        
+        question = await atake_speculative_question(state, config) if speculate else None
+        
+        if not question:
+            question = await aask_next_question(state["role"], resume_entries(state)[entry_index], context_messages(state, summary, summarized))
+        
+        return next_question_update(state, entry_index, question, summary, summarized)
+
+    def followup_question_prompt(state, summary, summarized):
+        subject = state["history"][state["topic_start"]].content
+        
+        return template_followup_question.invoke({
+            "role": state["role"],
+            "entry": current_resume_entry(state),
+            "history": context_messages(state, summary, summarized),
+            "subject": subject
+        })
+
+    def followup_question_update(state, question, summary, summarized):
+        return {
+            "question": question,
+            "total_followups": state["total_followups"] + 1,
+            "history": [AIMessage(content=question)],
+            "summary": summary,
+            "summarized": summarized
+        }
+
+    def handle_followup_question(state, config):
+        summary, summarized = take_summary(state, config)
+        
+        question = followup_question_llm.invoke(followup_question_prompt(state, summary, summarized))
+        
+        return followup_question_update(state, question.content, summary, summarized)
+
+    async def ahandle_followup_question(state, config):
+        summary, summarized = take_summary(state, config)
+        
+        question = await followup_question_llm.ainvoke(followup_question_prompt(state, summary, summarized))
+        
+        return followup_question_update(state, question.content, summary, summarized)
+        
+    def human_answer_question(state, config):
+        # Once the follow-ups of a subject are exhausted, the next question moves on to another entry of the resume. It is generated while the
+        # candidate is still typing, hiding the model's latency behind their think time.
+        if speculate and state["total_followups"] == max_followups and state["total_questions"] < max_questions:
+            background_tasks.submit(config["configurable"]["thread_id"], ("next_question", len(state["history"])), ask_next_question, aask_next_question, state["role"], resume_entries(state)[next_resume_entry(state)], context_messages(state, state.get("summary"), state.get("summarized") or 0), background_config(config))
+        
+        # The judgement reads the answers' scores, not the summary.
+        if state["total_questions"] < max_questions or state["total_followups"] < max_followups:
+            submit_summary(state, config)
+        
+        answer = interrupt(state["question"])
+        
+        history = [HumanMessage(content=answer)]
+        
+        # Scored while the next question is written.
+        submit_answer_scores({**state, "history": state["history"] + history}, config)
+        
+        return {
+            "history": history
+        }
+
+    async def ahuman_answer_question(state, config):
+        return human_answer_question(state, config)
+
+    def judgement_prompt(state, answer_scores):
+        notes = "\n".join(f"- {question} ({score}/100) {note or ""}" for question, score, note in answer_scores)
+        
+        return template_judgement.invoke({"role": state["role"], "notes": notes or "none of the answers could be scored.", "properties": schema_properties(Judgement)})
+
+    def judgement_update(config, judgement, answer_scores):
+        has_passed, recommendation = read_judgement(model_output(judgement))
+        
+        background_tasks.discard(config["configurable"]["thread_id"])
+        
+        score = round(sum(score for _, score, _ in answer_scores) / len(answer_scores)) if answer_scores else 0
+        
+        return {"result": recommendation, "has_passed": has_passed, "score": score}
+        
+    def judge_candidate(state, config):
+        answer_scores = take_answer_scores(state, config)
+        
+        judgement = structured_output(judgement_llm, Judgement).invoke(judgement_prompt(state, answer_scores))
+        
+        return judgement_update(config, judgement, answer_scores)
+
+    async def ajudge_candidate(state, config):
+        answer_scores = await atake_answer_scores(state, config)
+        
+        judgement = await structured_output(judgement_llm, Judgement).ainvoke(judgement_prompt(state, answer_scores))
+        
+        return judgement_update(config, judgement, answer_scores)
+    
+    def check_for_followup_or_judgement(state):
+        if state["total_questions"] ==  max_questions and state["total_followups"] == max_followups:
+            return "judge_candidate"
+        
+        elif state["total_followups"] < max_followups:
+            return "handle_followup_question"
+        
+        else:
+            return "handle_next_question"
+        
+    workflow.add_node("handle_next_question", RunnableLambda(handle_next_question, afunc=ahandle_next_question))
+    workflow.add_node("handle_followup_question", RunnableLambda(handle_followup_question, afunc=ahandle_followup_question))
+    workflow.add_node("judge_candidate", RunnableLambda(judge_candidate, afunc=ajudge_candidate))
+    workflow.add_node("human_answer_question", RunnableLambda(human_answer_question, afunc=ahuman_answer_question))
+
+    workflow.set_entry_point("handle_next_question")
+
+    workflow.add_edge("handle_next_question", "human_answer_question")
+    workflow.add_edge("handle_followup_question", "human_answer_question")
+
+    workflow.add_conditional_edges("human_answer_question", check_for_followup_or_judgement)    
+    
+    return background_tasks
+
+# Chat models are cached, so every caller asking for the same model gets the same client and its pool of connections. Given several base URLs,
+# the servers behind them are expected to serve the same model, and calls are spread across them, see EndpointPool.
+@functools.cache
+def setup_llm(keep_alive, model=DEFAULT_MODEL, base_urls=(), backend="ollama", timeout=DEFAULT_MODEL_TIMEOUT):
+    import httpx
+    
+    if len(base_urls) > 1:
+        chat_models = {base_url: setup_llm(keep_alive, model, (base_url,), backend, timeout) for base_url in base_urls}
+        
+        return setup_model_router(chat_models, EndpointPool(base_urls, backend), model_connection_errors(backend), model_timeout_errors(backend))
+    
+    base_url = base_urls[0] if base_urls else None
+    
+    limits = httpx.Limits(max_connections=MODEL_CONNECTIONS, max_keepalive_connections=MODEL_CONNECTIONS, keepalive_expiry=MODEL_KEEPALIVE_EXPIRY)
+    
+    # A server that is down is noticed long before a slow answer would be.
+    timeout = httpx.Timeout(timeout, connect=min(timeout, 5))
+    
+    if backend == "openai":
+        from langchain_openai import ChatOpenAI
+        
+        # Local servers ignore the API key, but the client refuses to start without one.
+        return ChatOpenAI(
+            model=model,
+            base_url=base_url or DEFAULT_OPENAI_BASE_URL,
+            api_key=os.environ.get("OPENAI_API_KEY", "unused"),
+            timeout=timeout,
+            # Retries are left to setup_model_policy.
+            max_retries=0,
+            http_client=httpx.Client(limits=limits),
+            http_async_client=httpx.AsyncClient(limits=limits)
+        )
+    
+    return setup_ollama_model(model=model, base_url=base_url, keep_alive=keep_alive, client_kwargs={"limits": limits, "timeout": timeout})
+
+class ContextBudget:
+    # Sizes the context window of the prompts sent to one model, whose token counts are estimated from their length. The ratio of characters
+    # to tokens is calibrated with the number of tokens Ollama reports having evaluated for every prompt.
+    def __init__(self, windows=CONTEXT_WINDOWS):
+        self.windows = windows
+        self.window = windows[0]
+        self.chars_per_token = CHARS_PER_TOKEN
+        self.lock = threading.Lock()
+    
+    def count_tokens(self, messages):
+        return round(sum(len(str(message.content)) for message in messages) / self.chars_per_token) + MESSAGE_TOKENS * len(messages)
+    
+    def fit(self, messages):
+        # Returns the messages that fit in the largest window, their estimated token count and the window to use. Prompts start with their system
+        # messages and end with the node's instructions, so the messages dropped are the oldest turns in between.
+        messages = list(messages)
+        
+        start = next((index for index, message in enumerate(messages) if message.type != "system"), len(messages))
+        
+        tokens = self.count_tokens(messages)
+        
+        while tokens + RESPONSE_TOKENS > self.windows[-1] and len(messages) - start > 1:
+            tokens -= self.count_tokens([messages.pop(start)])
+        
+        with self.lock:
+            self.window = next((window for window in self.windows if window >= max(tokens + RESPONSE_TOKENS, self.window)), self.windows[-1])
+            
+            return messages, tokens, self.window
+    
+    def calibrate(self, messages, prompt_tokens):
+        # Ollama only counts the tokens it evaluated, which leaves out the part of the prompt it had cached. Counts that far from the estimate are
+        # skipped, and the others only nudge the ratio.
+        if not prompt_tokens:
+            return
+        
+        chars_per_token = sum(len(str(message.content)) for message in messages) / max(prompt_tokens - MESSAGE_TOKENS * len(messages), 1)
+        
+        if 2 <= chars_per_token <= 8:
+            with self.lock:
+                self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * chars_per_token
+
+def setup_ollama_model(**kwargs):
+    from typing import Any
+    from langchain_ollama import ChatOllama
+    
+    # ChatOllama with num_ctx sized for every prompt by a ContextBudget. The window and the estimated token count are added to Ollama's counters
+    # in the response, where InterviewMetrics finds them.
+    class BudgetedChatOllama(ChatOllama):
+        context_budget: Any
+        
+        def fit(self, messages):
+            fitted_messages, tokens, window = self.context_budget.fit(messages)
+            
+            dropped = len(messages) - len(fitted_messages)
+            
+            if dropped:
+                click.secho(f"The {dropped} oldest messages of a prompt were left out for it to fit in the context window of {window} tokens.", fg="yellow", err=True)
+            
+            if tokens + RESPONSE_TOKENS > window:
+                click.secho(f"A prompt of about {tokens} tokens is too long for the context window of {window} tokens, Ollama will cut it.", fg="yellow", err=True)
+            
+            return fitted_messages, tokens, window, dropped
+        
+        def budgeted(self, part, messages, tokens, window, dropped):
+            if isinstance(part, str) or not part.get("done"):
+                return part
+            
+            self.context_budget.calibrate(messages, part.get("prompt_eval_count"))
+            
+            return {**dict(part), "num_ctx": window, "estimated_prompt_tokens": tokens, "dropped_messages": dropped}
+        
+        def _chat_params(self, messages, stop=None, num_ctx=None, **kwargs):
+            params = super()._chat_params(messages, stop, **kwargs)
+            
+            params["options"].num_ctx = num_ctx or params["options"].num_ctx
+            
+            return params
+        
+        def _create_chat_stream(self, messages, stop=None, **kwargs):
+            fitted_messages, tokens, window, dropped = self.fit(messages)
+            
+            for part in super()._create_chat_stream(fitted_messages, stop, num_ctx=window, **kwargs):
+                yield self.budgeted(part, fitted_messages, tokens, window, dropped)
+        
+        async def _acreate_chat_stream(self, messages, stop=None, **kwargs):
+            fitted_messages, tokens, window, dropped = self.fit(messages)
+            
+            async for part in super()._acreate_chat_stream(fitted_messages, stop, num_ctx=window, **kwargs):
+                yield self.budgeted(part, fitted_messages, tokens, window, dropped)
+    
+    return BudgetedChatOllama(context_budget=ContextBudget(), **kwargs)
+
+def check_model_backend(backend):
+    if backend == "openai" and not importlib.util.find_spec("langchain_openai"):
+        raise click.UsageError("The openai backend requires langchain-openai. Install it with: pip install smithers-llm[openai]")
+
+def model_connection_errors(backend):
+    from httpx import ConnectError
+    
+    # Newer versions of the ollama client raise the builtin ConnectionError instead of httpx's.
+    if backend == "openai":
+        from openai import APIConnectionError
+        
+        return (ConnectError, ConnectionError, APIConnectionError)
+    
+    return (ConnectError, ConnectionError)
+
+def model_timeout_errors(backend):
+    from httpx import TimeoutException
+    
+    if backend == "openai":
+        from openai import APITimeoutError
+        
+        return (TimeoutException, APITimeoutError)
+    
+    return (TimeoutException,)
+
+def describe_model_server(model, base_urls, backend):
+    if backend == "openai":
+        return f"the server at {", ".join(base_urls or [DEFAULT_OPENAI_BASE_URL])} is serving {model}"
+    
+    if base_urls:
+        return f"Ollama is running {model} at {", ".join(base_urls)}"
+    
+    return f"Ollama is running {model}"
+
+class EndpointPool:
+    # Routes the model calls of many interviews across servers serving the same model. An interview sticks to the server that answered its first
+    # call, where its prompt is already cached, as long as that server is up. Interviews new to the pool, and those whose server went down, go to
+    # the server with the fewest requests in flight. Servers that fail to connect are taken out and probed in the background until they answer.
+    def __init__(self, endpoints, backend="ollama"):
+        self.endpoints = list(endpoints)
+        self.backend = backend
+        self.outstanding = {endpoint: 0 for endpoint in self.endpoints}
+        self.healthy = {endpoint: True for endpoint in self.endpoints}
+        self.sticky = collections.OrderedDict()
+        self.lock = threading.Lock()
+        
+        threading.Thread(target=self.check_health, daemon=True, name="smithers-health").start()
+    
+    def acquire(self, thread_id=None, exclude=()):
+        with self.lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+            
+            # When every server is marked down, they are tried anyway, as the last probe may already be outdated.
+            healthy = [endpoint for endpoint in candidates if self.healthy[endpoint]] or candidates
+            
+            endpoint = self.sticky.get(thread_id)
+            
+            if endpoint not in healthy:
+                endpoint = min(healthy, key=self.outstanding.get)
+            
+            if thread_id:
+                self.sticky[thread_id] = endpoint
+                self.sticky.move_to_end(thread_id)
+                
+                if len(self.sticky) > MAX_STICKY_SESSIONS:
+                    self.sticky.popitem(last=False)
+            
+            self.outstanding[endpoint] += 1
+            
+            return endpoint
+    
+    def release(self, endpoint):
+        with self.lock:
+            self.outstanding[endpoint] -= 1
+    
+    def mark_down(self, endpoint):
+        with self.lock:
+            self.healthy[endpoint] = False
+    
+    def health_url(self, endpoint):
+        # Both answer without touching the model.
+        if self.backend == "openai":
+            return endpoint.rstrip("/") + "/models"
+        
+        return endpoint.rstrip("/") + "/api/version"
+    
+    def check_health(self):
+        import httpx
+        
+        while True:
+            time.sleep(HEALTH_CHECK_INTERVAL)
+            
+            for endpoint in [endpoint for endpoint in self.endpoints if not self.healthy[endpoint]]:
+                try:
+                    httpx.get(self.health_url(endpoint), timeout=2).raise_for_status()
+                except (httpx.HTTPError, httpx.InvalidURL):
+                    continue
+                
+                with self.lock:
+                    self.healthy[endpoint] = True
+
+def setup_model_router(chat_models, endpoint_pool, connection_errors, timeout_errors):
+    from typing import Any
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.runnables import RunnableLambda
+    
+    # A chat model that hands every call to the chat model of the endpoint picked by the pool. The interview's thread id comes from the metadata
+    # LangGraph passes down to every call made within a node. A call that fails to connect is retried on another endpoint, unless tokens were
+    # already streamed.
+    class ModelRouter(BaseChatModel):
+        chat_models: dict
+        endpoint_pool: Any
+        connection_errors: tuple
+        timeout_errors: tuple
+        
+        @property
+        def _llm_type(self):
+            return "router"
+        
+        def _get_ls_params(self, stop=None, **kwargs):
+            return next(iter(self.chat_models.values()))._get_ls_params(stop=stop, **kwargs)
+        
+        def fail_over(self, endpoint, tried, error):
+            # Returns whether another endpoint is left to try. A timeout only says the endpoint is slow, and what to do about it is up to the
+            # retry policy, see setup_model_policy.
+            if isinstance(error, self.timeout_errors):
+                return False
+            
+            self.endpoint_pool.mark_down(endpoint)
+            
+            tried.add(endpoint)
+            
+            return len(tried) < len(self.chat_models)
+        
+        def call(self, thread_id, function):
+            tried = set()
+            
+            while True:
+                endpoint = self.endpoint_pool.acquire(thread_id, tried)
+                
+                try:
+                    return endpoint, function(self.chat_models[endpoint])
+                except self.connection_errors as error:
+                    if not self.fail_over(endpoint, tried, error):
+                        raise
+                finally:
+                    self.endpoint_pool.release(endpoint)
+        
+        async def acall(self, thread_id, function):
+            tried = set()
+            
+            while True:
+                endpoint = self.endpoint_pool.acquire(thread_id, tried)
+                
+                try:
+                    return endpoint, await function(self.chat_models[endpoint])
+                except self.connection_errors as error:
+                    if not self.fail_over(endpoint, tried, error):
+                        raise
+                finally:
+                    self.endpoint_pool.release(endpoint)
+        
+        def with_endpoint(self, endpoint, result):
+            # Tells traces which server answered.
+            for generation in result.generations:
+                generation.message.response_metadata["endpoint"] = endpoint
+            
+            return result
+        
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            thread_id = run_manager.metadata.get("thread_id") if run_manager else None
+            
+            return self.with_endpoint(*self.call(thread_id, lambda chat_model: chat_model._generate(messages, stop, run_manager, **kwargs)))
+        
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            thread_id = run_manager.metadata.get("thread_id") if run_manager else None
+            
+            return self.with_endpoint(*await self.acall(thread_id, lambda chat_model: chat_model._agenerate(messages, stop, run_manager, **kwargs)))
+        
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            thread_id = run_manager.metadata.get("thread_id") if run_manager else None
+            
+            tried = set()
+            
+            while True:
+                endpoint = self.endpoint_pool.acquire(thread_id, tried)
+                
+                has_streamed = False
+                
+                try:
+                    for chunk in self.chat_models[endpoint]._stream(messages, stop, run_manager, **kwargs):
+                        if not has_streamed:
+                            chunk.generation_info = {**(chunk.generation_info or {}), "endpoint": endpoint}
+                        
+                        has_streamed = True
+                        
+                        yield chunk
+                    
+                    return
+                except self.connection_errors as error:
+                    if has_streamed or not self.fail_over(endpoint, tried, error):
+                        raise
+                finally:
+                    self.endpoint_pool.release(endpoint)
+        
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            thread_id = run_manager.metadata.get("thread_id") if run_manager else None
+            
+            tried = set()
+            
+            while True:
+                endpoint = self.endpoint_pool.acquire(thread_id, tried)
+                
+                has_streamed = False
+                
+                try:
+                    async for chunk in self.chat_models[endpoint]._astream(messages, stop, run_manager, **kwargs):
+                        if not has_streamed:
+                            chunk.generation_info = {**(chunk.generation_info or {}), "endpoint": endpoint}
+                        
+                        has_streamed = True
+                        
+                        yield chunk
+                    
+                    return
+                except self.connection_errors as error:
+                    if has_streamed or not self.fail_over(endpoint, tried, error):
+                        raise
+                finally:
+                    self.endpoint_pool.release(endpoint)
+        
+        def with_structured_output(self, schema, **kwargs):
+            # The output of a structured call is parsed before it gets here, so the endpoint goes in the metadata of the chat model's run instead,
+            # which traces read it from.
+            structured_models = {id(chat_model): structured_output(chat_model, schema).with_config(metadata={"endpoint": endpoint}) for endpoint, chat_model in self.chat_models.items()}
+            
+            def invoke(prompt, config):
+                return self.call(config["metadata"].get("thread_id"), lambda chat_model: structured_models[id(chat_model)].invoke(prompt))[1]
+            
+            async def ainvoke(prompt, config):
+                return (await self.acall(config["metadata"].get("thread_id"), lambda chat_model: structured_models[id(chat_model)].ainvoke(prompt)))[1]
+            
+            return RunnableLambda(invoke, afunc=ainvoke)
+    
+    return ModelRouter(chat_models=chat_models, endpoint_pool=endpoint_pool, connection_errors=connection_errors, timeout_errors=timeout_errors)
+
+def setup_model(keep_alive, model=DEFAULT_MODEL, base_urls=(), backend="ollama", timeout=DEFAULT_MODEL_TIMEOUT, retries=DEFAULT_MODEL_RETRIES, fallback_model=None, latency_slo=DEFAULT_LATENCY_SLO):
+    # With a fallback model, the primary one only has until the latency SLO to answer.
+    llm_timeout = min(timeout, latency_slo) if fallback_model else timeout
+    
+    llm = setup_llm(keep_alive, model, base_urls, backend, llm_timeout)
+    
+    fallback_llm = setup_llm(keep_alive, fallback_model, base_urls, backend, timeout) if fallback_model else None
+    
+    return setup_model_policy(llm, fallback_llm, retries, model_connection_errors(backend), model_timeout_errors(backend), llm_timeout, timeout)
+
+def setup_models(keep_alive, model, node_models, base_urls=(), backend="ollama", timeout=DEFAULT_MODEL_TIMEOUT, retries=DEFAULT_MODEL_RETRIES, fallback_model=None, latency_slo=DEFAULT_LATENCY_SLO):
+    # The chat model of every node, and the chat models of the nodes given their own by name, see MODEL_NODES.
+    llm = setup_model(keep_alive, model, base_urls, backend, timeout, retries, fallback_model, latency_slo)
+    
+    node_llms = {node: setup_model(keep_alive, node_model, base_urls, backend, timeout, retries, fallback_model, latency_slo) for node, node_model in node_models.items()}
+    
+    return llm, node_llms
+
+def retry_delay(attempt):
+    # Full jitter keeps the sessions that failed together from retrying together.
+    # https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt))
+
+def call_with_timeout(function, timeout, *args):
+    # Stops waiting for a sync call after timeout seconds, the way asyncio.wait_for does for a coroutine. The client's own timeout only bounds
+    # the wait for every streamed chunk, and Ollama streams even the calls that aren't. The call itself can't be interrupted, so it goes on
+    # in a daemon thread until the server answers or the client gives up.
+    import contextvars
+    
+    if timeout is None:
+        return function(*args)
+    
+    outcome = {}
+    
+    # The thread runs in the caller's context, which holds the run the call belongs to.
+    context = contextvars.copy_context()
+    
+    def run():
+        try:
+            outcome["result"] = context.run(function, *args)
+        except BaseException as error:
+            outcome["error"] = error
+    
+    thread = threading.Thread(target=run, name="smithers-model-call", daemon=True)
+    
+    thread.start()
+    thread.join(timeout)
+    
+    if thread.is_alive():
+        raise model_timeout_error(timeout)
+    
+    if "error" in outcome:
+        raise outcome["error"]
+    
+    return outcome["result"]
+
+async def await_with_timeout(awaitable, timeout, message_timeout=None):
+    import asyncio
+    
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except TimeoutError as error:
+        raise model_timeout_error(message_timeout or timeout) from error
+
+def model_timeout_error(timeout):
+    # The error of a model call that ran out of time as a whole, raised as the client's own so that it is retried and reported the same way.
+    from httpx import TimeoutException
+    
+    return TimeoutException(f"The model didn't answer within {timeout:g} seconds.")
+
+def setup_model_policy(llm, fallback_llm, retries, connection_errors, timeout_errors, timeout=None, fallback_timeout=None):
+    import asyncio
+    from typing import Any, Optional
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.runnables import RunnableLambda
+    
+    # A chat model that retries the calls of another one when they fail in a way that may not happen again, and hands them to the fallback model
+    # once the retries are exhausted, or right away when the primary model misses its latency SLO. Streamed calls are only retried until their
+    # first token. Every attempt has until the timeout of its chat model to be over, the primary model's being the latency SLO when there is a
+    # fallback model. A stream only has until the SLO for its first token, after which it can't be handed over anymore, and until the timeout
+    # for the rest.
+    class ResilientChatModel(BaseChatModel):
+        llm: Any
+        fallback_llm: Optional[Any] = None
+        retries: int
+        connection_errors: tuple
+        timeout_errors: tuple
+        timeout: Optional[float] = None
+        fallback_timeout: Optional[float] = None
+        
+        @property
+        def _llm_type(self):
+            return "resilient"
+        
+        def _get_ls_params(self, stop=None, **kwargs):
+            return self.llm._get_ls_params(stop=stop, **kwargs)
+        
+        def next_attempt(self, llm, attempt, error):
+            # Returns the chat model and the attempt number of the next try, None when the error is final.
+            is_transient = isinstance(error, self.connection_errors + self.timeout_errors) or getattr(error, "status_code", None) in TRANSIENT_STATUS_CODES
+            
+            if not is_transient:
+                return None
+            
+            if llm is not self.fallback_llm and self.fallback_llm is not None and (isinstance(error, self.timeout_errors) or attempt >= self.retries):
+                return self.fallback_llm, 0
+            
+            if attempt >= self.retries:
+                return None
+            
+            return llm, attempt + 1
+        
+        def timeout_of(self, llm, has_streamed=False):
+            if llm is self.fallback_llm or has_streamed and self.fallback_llm is not None:
+                return self.fallback_timeout
+            
+            return self.timeout
+        
+        def check_deadline(self, llm, started_at, has_streamed):
+            timeout = self.timeout_of(llm, has_streamed)
+            
+            if timeout is not None and time.monotonic() - started_at > timeout:
+                raise model_timeout_error(timeout)
+        
+        async def anext_chunk(self, llm, chunks, started_at, has_streamed):
+            # The next chunk of a stream, or None at its end.
+            timeout = self.timeout_of(llm, has_streamed)
+            
+            if timeout is None:
+                return await anext(chunks, None)
+            
+            return await await_with_timeout(anext(chunks, None), max(timeout - (time.monotonic() - started_at), 0), timeout)
+        
+        def call(self, function):
+            llm, attempt = self.llm, 0
+            
+            while True:
+                try:
+                    return call_with_timeout(function, self.timeout_of(llm), llm)
+                except Exception as error:
+                    retry = self.next_attempt(llm, attempt, error)
+                    
+                    if retry is None:
+                        raise
+                
+                if retry[0] is llm:
+                    time.sleep(retry_delay(attempt))
+                
+                llm, attempt = retry
+        
+        async def acall(self, function):
+            llm, attempt = self.llm, 0
+            
+            while True:
+                try:
+                    return await await_with_timeout(function(llm), self.timeout_of(llm))
+                except Exception as error:
+                    retry = self.next_attempt(llm, attempt, error)
+                    
+                    if retry is None:
+                        raise
+                
+                if retry[0] is llm:
+                    await asyncio.sleep(retry_delay(attempt))
+                
+                llm, attempt = retry
+        
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            return self.call(lambda llm: llm._generate(messages, stop, run_manager, **kwargs))
+        
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            return await self.acall(lambda llm: llm._agenerate(messages, stop, run_manager, **kwargs))
+        
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            llm, attempt = self.llm, 0
+            
+            while True:
+                has_streamed = False
+                
+                started_at = time.monotonic()
+                
+                try:
+                    # A chunk that never comes is left to the client's timeout, which is the same.
+                    for chunk in llm._stream(messages, stop, run_manager, **kwargs):
+                        self.check_deadline(llm, started_at, has_streamed)
+                        
+                        has_streamed = True
+                        
+                        yield chunk
+                    
+                    return
+                except Exception as error:
+                    retry = None if has_streamed else self.next_attempt(llm, attempt, error)
+                    
+                    if retry is None:
+                        raise
+                
+                if retry[0] is llm:
+                    time.sleep(retry_delay(attempt))
+                
+                llm, attempt = retry
+        
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            llm, attempt = self.llm, 0
+            
+            while True:
+                has_streamed = False
+                
+                started_at = time.monotonic()
+                
+                try:
+                    chunks = llm._astream(messages, stop, run_manager, **kwargs)
+                    
+                    while (chunk := await self.anext_chunk(llm, chunks, started_at, has_streamed)) is not None:
+                        has_streamed = True
+                        
+                        yield chunk
+                    
+                    return
+                except Exception as error:
+                    retry = None if has_streamed else self.next_attempt(llm, attempt, error)
+                    
+                    if retry is None:
+                        raise
+                
+                if retry[0] is llm:
+                    await asyncio.sleep(retry_delay(attempt))
+                
+                llm, attempt = retry
+        
+        def with_structured_output(self, schema, **kwargs):
+            def invoke(prompt):
+                return self.call(lambda llm: structured_output(llm, schema).invoke(prompt))
+            
+            async def ainvoke(prompt):
+                return await self.acall(lambda llm: structured_output(llm, schema).ainvoke(prompt))
+            
+            return RunnableLambda(invoke, afunc=ainvoke)
+    
+    return ResilientChatModel(llm=llm, fallback_llm=fallback_llm, retries=retries, connection_errors=connection_errors, timeout_errors=timeout_errors, timeout=timeout, fallback_timeout=fallback_timeout)
+
+def structured_output(llm, schema):
+    from langchain_core.runnables import RunnableLambda
+    
+    # The model's output is constrained to the schema's JSON by the server's grammar, rather than asked for through tool calling, and read with
+    # parse_model_json, so a malformed answer is repaired here instead of costing another call. Other chat models, such as the router and the
+    # retry policy, hand the schema down to the chat model they call.
+    # https://github.com/ollama/ollama/blob/main/docs/api.md#request-structured-outputs
+    if llm._llm_type == "chat-ollama":
+        constrained_llm = llm.bind(format=schema.model_json_schema())
+    
+    elif llm._llm_type == "openai-chat":
+        constrained_llm = llm.bind(response_format={"type": "json_schema", "json_schema": {"name": schema.__name__, "schema": schema.model_json_schema()}})
+    
+    else:
+        return llm.with_structured_output(schema)
+    
+    return constrained_llm | RunnableLambda(lambda message: parse_model_json(message.content))
+
+def parse_model_json(text):
+    # The JSON object in a model's answer, repairing what usually goes wrong without a grammar: code fences or text around the object, trailing
+    # commas, and an answer cut short by the token limit. As a last resort, the properties with a plain value are picked out one by one. An answer
+    # with nothing to read gives an empty object.
+    start = text.find("{")
+    
+    # An answer that is valid as it stands is read up to the end of its object, whatever its strings hold and whatever follows it.
+    if start != -1:
+        try:
+            value, _ = json.JSONDecoder().raw_decode(text, start)
+        except json.JSONDecodeError:
+            value = None
+        
+        if isinstance(value, dict):
+            return value
+    
+    end = text.rfind("}")
+    
+    candidate = text[start:end + 1] if start < end else text[start:] if start != -1 else text
+    
+    candidate = re.sub(r",\s*([}\]])", r"\1", candidate.strip())
+    
+    for repaired in (candidate, candidate + "}", candidate + "\"}"):
+        try:
+            value = json.loads(repaired)
+        except json.JSONDecodeError:
+            continue
+        
+        if isinstance(value, dict):
+            return value
+    
+    return {key: json.loads(value) for key, value in re.findall(r'"(\w+)"\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?|true|false)', text)}
+
+def read_judgement(judgement):
+    # Returns whether the candidate passed and the recommendation of a judgement as the model wrote it. A judgement that can't be read must not
+    # lose the interview at its very end, so what's missing or invalid falls back to not passing.
+    has_passed = str(judgement.get("has_passed", "")).strip().lower() in ("yes", "true")
+    
+    recommendation = judgement.get("recommendation")
+    
+    if not isinstance(recommendation, str) or not recommendation.strip():
+        recommendation = "The model's judgement could not be read."
+    
+    return has_passed, recommendation
+
+def read_score(score):
+    # A score out of 100 as the model wrote it, such as 85, "85" or "85/100", or None when it can't be read. Scores written out of another
+    # total, such as "8.5/10", are scaled to 100.
+    numerator, _, denominator = str(score).partition("/")
+    
+    try:
+        value = float(numerator) * 100 / float(denominator) if denominator.strip() else float(numerator)
+        
+        return min(max(round(value), 0), 100)
+    except (ValueError, OverflowError, ZeroDivisionError):
+        return None
+
+def setup_app(llm, max_questions, speculate=False, checkpoint_db=None, asynchronous=False, node_llms=None):
+    template_next_question, template_followup_question, template_answer_score, template_judgement, template_summary = setup_prompt_templates()
+    
+    workflow = setup_state()
+    
+    background_tasks = setup_graph_nodes(llm, workflow, template_next_question, template_followup_question, template_answer_score, template_judgement, template_summary, max_questions, MAX_FOLLOWUPS, speculate, node_llms)
+    
+    app = setup_checkpointer(workflow, checkpoint_db, asynchronous)
+    
+    # For the work of a session to be dropped when it ends before the judgement, see InterviewEngine.
+    app.background_tasks = background_tasks
+    
+    return app
+
+def setup_checkpointer(workflow, checkpoint_db=None, asynchronous=False):
+    from langgraph.checkpoint.memory import MemorySaver
+    
+    if checkpoint_db:
+        os.makedirs(os.path.dirname(os.path.abspath(checkpoint_db)), exist_ok=True)
+        
+        if asynchronous:
+            import aiosqlite
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            
+            checkpointer = AsyncSqliteSaver(aiosqlite.connect(checkpoint_db))
+        else:
+            from langgraph.checkpoint.sqlite import SqliteSaver
+            
+            checkpointer = SqliteSaver(sqlite3.connect(checkpoint_db, check_same_thread=False))
+    else:
+        checkpointer = MemorySaver()
+
+    app = workflow.compile(checkpointer=checkpointer)
+    
+    return app
+
+def prune_checkpoints(checkpoint_db, max_sessions):
+    # A session only needs its latest checkpoint, and the writes pending on it, to be resumed. Every other checkpoint holds a full copy of the
+    # state, so they are dropped along with the sessions beyond the most recent ones. Checkpoint ids are time ordered.
+    connection = sqlite3.connect(checkpoint_db)
+    
+    # The checkpointer only creates its tables when the first interview is saved.
+    if not connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'checkpoints'").fetchone():
+        connection.close()
+        
+        return
+    
+    with connection:
+        connection.execute("""
+            DELETE FROM checkpoints WHERE thread_id NOT IN (
+                SELECT thread_id FROM checkpoints GROUP BY thread_id ORDER BY MAX(checkpoint_id) DESC LIMIT ?
+            )
+        """, (max_sessions,))
+        
+        connection.execute("""
+            DELETE FROM checkpoints WHERE checkpoint_id NOT IN (
+                SELECT MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id, checkpoint_ns
+            )
+        """)
+        
+        connection.execute("""
+            DELETE FROM writes WHERE NOT EXISTS (
+                SELECT 1 FROM checkpoints
+                WHERE checkpoints.thread_id = writes.thread_id
+                AND checkpoints.checkpoint_ns = writes.checkpoint_ns
+                AND checkpoints.checkpoint_id = writes.checkpoint_id
+            )
+        """)
+    
+    connection.execute("VACUUM")
+    
+    connection.close()
+
+def initial_state(role, docs_content):
+    return {
+        "role": role,
+        "context": docs_content,
+        "entries": segment_resume(docs_content),
+        "covered_entries": [],
+        "total_questions": 0,
+        "total_followups": 0,
+        "history": [],
+        "topic_start": 0,
+        "result": "",
+    }
+
+def get_question_index(interview):
+    return (interview["total_questions"] - 1) * (MAX_FOLLOWUPS + 1) + interview["total_followups"] + 1
+
+def is_question_token(chunk, metadata):
+    from langchain_core.messages import AIMessageChunk
+    
+    # Besides the model's chunks, the messages a node writes to the state are streamed too, and the question must not be printed twice.
+    return metadata["langgraph_node"] in ("handle_next_question", "handle_followup_question") and isinstance(chunk, AIMessageChunk) and bool(chunk.content)
+
+class InterviewMetrics:
+    # Wall time of every node run of one interview, along with the counters Ollama returns with every response, aggregated per node.
+    # Durations reported by Ollama are in nanoseconds. Model calls made in the background, such as speculative questions, count towards the node
+    # that started them.
+    # https://github.com/ollama/ollama/blob/main/docs/api.md#response
+    def __init__(self):
+        self.nodes = collections.defaultdict(collections.Counter)
+        self.lock = threading.Lock()
+        self.callback_handler = None
+    
+    def record_node_run(self, node, wall_time):
+        with self.lock:
+            self.nodes[node]["runs"] += 1
+            self.nodes[node]["wall_time"] += wall_time
+    
+    def record_llm_call(self, node, response_metadata):
+        with self.lock:
+            self.nodes[node]["llm_calls"] += 1
+            self.nodes[node]["prompt_tokens"] += response_metadata.get("prompt_eval_count") or 0
+            self.nodes[node]["generated_tokens"] += response_metadata.get("eval_count") or 0
+            self.nodes[node]["generation_time"] += (response_metadata.get("eval_duration") or 0) / 1e9
+            self.nodes[node]["load_time"] += (response_metadata.get("load_duration") or 0) / 1e9
+            self.nodes[node]["estimated_prompt_tokens"] += response_metadata.get("estimated_prompt_tokens") or 0
+            self.nodes[node]["dropped_messages"] += response_metadata.get("dropped_messages") or 0
+            self.nodes[node]["context_window"] = max(self.nodes[node]["context_window"], response_metadata.get("num_ctx") or 0)
+    
+    def summary(self):
+        with self.lock:
+            nodes = {node: collections.Counter(counters) for node, counters in self.nodes.items()}
+        
+        # The context window is the largest one used, not a sum.
+        context_window = max((counters["context_window"] for counters in nodes.values()), default=0)
+        
+        nodes["total"] = sum(nodes.values(), collections.Counter())
+        nodes["total"]["context_window"] = context_window
+        
+        return {
+            node: {
+                "runs": counters["runs"],
+                "wall_time": counters["wall_time"],
+                "llm_calls": counters["llm_calls"],
+                "prompt_tokens": counters["prompt_tokens"],
+                "generated_tokens": counters["generated_tokens"],
+                "tokens_per_second": counters["generated_tokens"] / counters["generation_time"] if counters["generation_time"] else None,
+                "load_time": counters["load_time"],
+                "estimated_prompt_tokens": counters["estimated_prompt_tokens"],
+                "context_window": counters["context_window"] or None,
+                "dropped_messages": counters["dropped_messages"],
+            }
+            for node, counters in nodes.items()
+        }
+    
+    def handler(self):
+        if self.callback_handler is None:
+            self.callback_handler = setup_metrics_handler(self)
+        
+        return self.callback_handler
+
+def setup_metrics_handler(metrics):
+    from langchain_core.callbacks import BaseCallbackHandler
+    
+    class MetricsCallbackHandler(BaseCallbackHandler):
+        # Recording is cheap enough to run on the event loop instead of the executor async callbacks are otherwise sent to.
+        run_inline = True
+        
+        def __init__(self):
+            self.node_runs = {}
+            self.llm_runs = {}
+        
+        def on_chain_start(self, serialized, inputs, *, run_id, tags=None, metadata=None, **kwargs):
+            # A node shows up as several nested runs under its name, but only the outermost one is tagged with the step of the graph. LangGraph's own
+        # nodes, such as __start__, are left out.
+            if metadata and any(tag.startswith("graph:step:") for tag in tags or []) and not metadata["langgraph_node"].startswith("__"):
+                self.node_runs[run_id] = (metadata["langgraph_node"], time.perf_counter())
+        
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            if run_id in self.node_runs:
+                node, started_at = self.node_runs.pop(run_id)
+                
+                metrics.record_node_run(node, time.perf_counter() - started_at)
+        
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            # Interrupting for the candidate's answer also ends up here, and the time spent waiting for it is not the graph's.
+            self.node_runs.pop(run_id, None)
+        
+        def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+            self.llm_runs[run_id] = (metadata or {}).get("langgraph_node")
+        
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            node = self.llm_runs.pop(run_id, None)
+            
+            metrics.record_llm_call(node, response_counters(response))
+        
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self.llm_runs.pop(run_id, None)
+    
+    return MetricsCallbackHandler()
+
+def response_counters(response):
+    generation = response.generations[0][0]
+    
+    # Ollama's counters are in the generation info of the last streamed chunk, and are also copied to the message when it is not streamed.
+    counters = {**(generation.generation_info or {}), **generation.message.response_metadata}
+    
+    # OpenAI compatible servers only report token counts, in LangChain's own usage metadata.
+    usage_metadata = getattr(generation.message, "usage_metadata", None)
+    
+    if usage_metadata and "prompt_eval_count" not in counters:
+        counters.update({"prompt_eval_count": usage_metadata["input_tokens"], "eval_count": usage_metadata["output_tokens"]})
+    
+    return counters
+
+def print_metrics(metrics):
+    def format_value(value, unit=None):
+        return "-" if value is None else f"{value:.1f}{unit}" if unit is not None else str(value)
+    
+    rows = [("Node", "Runs", "Time", "Prompt tokens", "Generated tokens", "Tokens/s", "Load time", "Context window", "Dropped messages")]
+    
+    for node, node_metrics in metrics.summary().items():
+        rows.append((
+            node,
+            format_value(node_metrics["runs"]),
+            format_value(node_metrics["wall_time"], "s"),
+            format_value(node_metrics["prompt_tokens"]),
+            format_value(node_metrics["generated_tokens"]),
+            format_value(node_metrics["tokens_per_second"], ""),
+            format_value(node_metrics["load_time"], "s"),
+            format_value(node_metrics["context_window"]),
+            format_value(node_metrics["dropped_messages"]),
+        ))
+    
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    
+    for index, row in enumerate(rows):
+        click.secho("  ".join([row[0].ljust(widths[0])] + [value.rjust(width) for value, width in zip(row[1:], widths[1:])]), bold=index in (0, len(rows) - 1))
+
+class InterviewTracer:
+    # Spans of one interview, nested as session > graph node > model call, in the OTLP JSON format, so any OpenTelemetry collector or backend can
+    # take them without an OpenTelemetry SDK here. They are exported all at once when the interview ends, either appended as one line to a file,
+    # as the collector's file exporter does, or posted to an OTLP/HTTP endpoint such as http://localhost:4318/v1/traces.
+    # https://opentelemetry.io/docs/specs/otlp/#json-protobuf-encoding
+    export_lock = threading.Lock()
+    
+    def __init__(self, thread_id, destination, attributes=None):
+        self.thread_id = thread_id
+        self.destination = destination
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self.lock = threading.Lock()
+        self.callback_handler = None
+        self.has_exported = False
+        
+        self.session_span = self.start_span("interview", None, {"session.id": thread_id, **(attributes or {})})
+    
+    def start_span(self, name, parent_span, attributes, kind=1):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": os.urandom(8).hex(),
+            "parentSpanId": parent_span["spanId"] if parent_span else "",
+            "name": name,
+            "kind": kind,
+            "startTimeUnixNano": str(time.time_ns()),
+            "attributes": attributes,
+            "status": {},
+        }
+        
+        with self.lock:
+            self.spans.append(span)
+        
+        return span
+    
+    def end_span(self, span, attributes=None, error=None):
+        span["endTimeUnixNano"] = str(time.time_ns())
+        span["attributes"].update(attributes or {})
+        
+        if error is not None:
+            span["status"] = {"code": 2, "message": f"{type(error).__name__}: {error}"}
+    
+    def handler(self):
+        if self.callback_handler is None:
+            self.callback_handler = setup_tracing_handler(self)
+        
+        return self.callback_handler
+    
+    def export(self):
+        if self.has_exported:
+            return
+        
+        self.has_exported = True
+        
+        self.end_span(self.session_span)
+        
+        with self.lock:
+            # Spans left open by an interrupted run still go out, ending with the session.
+            spans = [
+                {**span, "endTimeUnixNano": span.get("endTimeUnixNano", self.session_span["endTimeUnixNano"]), "attributes": otlp_attributes(span["attributes"])}
+                for span in self.spans
+            ]
+        
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": otlp_attributes({"service.name": "smithers"})},
+                "scopeSpans": [{"scope": {"name": "smithers"}, "spans": spans}],
+            }]
+        }
+        
+        try:
+            if self.destination.startswith(("http://", "https://")):
+                import httpx
+                
+                httpx.post(self.destination, json=request, timeout=10).raise_for_status()
+            else:
+                with self.export_lock, open(self.destination, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(request) + "\n")
+        
+        # Losing a trace must never cost the candidate their interview.
+        except Exception as error:
+            click.secho(f"Failed to export the trace of session {self.thread_id}: {error}", fg="yellow", err=True)
+
+def otlp_attributes(attributes):
+    def otlp_value(value):
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        elif isinstance(value, int):
+            return {"intValue": str(value)}
+        elif isinstance(value, float):
+            return {"doubleValue": value}
+        else:
+            return {"stringValue": str(value)}
+    
+    return [{"key": key, "value": otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+def setup_tracing_handler(tracer):
+    from langchain_core.callbacks import BaseCallbackHandler
+    from langgraph.errors import GraphInterrupt
+    
+    class TracingCallbackHandler(BaseCallbackHandler):
+        run_inline = True
+        
+        def __init__(self):
+            self.node_spans = {}
+            self.llm_spans = {}
+        
+        def on_chain_start(self, serialized, inputs, *, run_id, tags=None, metadata=None, **kwargs):
+            # Same node runs as the ones InterviewMetrics times.
+            if not (metadata and any(tag.startswith("graph:step:") for tag in tags or []) and not metadata["langgraph_node"].startswith("__")):
+                return
+            
+            attributes = {"session.id": tracer.thread_id, "langgraph.node": metadata["langgraph_node"], "langgraph.step": metadata["langgraph_step"]}
+            
+            # The index of the last question asked when the node started.
+            if isinstance(inputs, dict) and inputs.get("total_questions"):
+                attributes["interview.question_index"] = get_question_index(inputs)
+            
+            span = tracer.start_span(metadata["langgraph_node"], tracer.session_span, attributes)
+            
+            self.node_spans[run_id] = (metadata["langgraph_checkpoint_ns"], span)
+        
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            if run_id in self.node_spans:
+                tracer.end_span(self.node_spans.pop(run_id)[1])
+        
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            if run_id in self.node_spans:
+                span = self.node_spans.pop(run_id)[1]
+                
+                # Waiting for the candidate's answer is not a failure.
+                if isinstance(error, GraphInterrupt):
+                    tracer.end_span(span, {"langgraph.interrupted": True})
+                else:
+                    tracer.end_span(span, error=error)
+        
+        def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+            metadata = metadata or {}
+            
+            # Model calls made within a node share its checkpoint namespace.
+            parent_span = next((span for checkpoint_ns, span in self.node_spans.values() if checkpoint_ns == metadata.get("langgraph_checkpoint_ns")), tracer.session_span)
+            
+            self.llm_spans[run_id] = tracer.start_span(" ".join(filter(None, ["chat", metadata.get("ls_model_name")])), parent_span, {
+                "session.id": tracer.thread_id,
+                "gen_ai.system": metadata.get("ls_provider"),
+                "gen_ai.request.model": metadata.get("ls_model_name"),
+                # Structured calls through ModelRouter tell the endpoint here rather than in their response.
+                "server.address": metadata.get("endpoint"),
+            }, kind=3)
+        
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            if run_id not in self.llm_spans:
+                return
+            
+            response_metadata = response_counters(response)
+            
+            span = self.llm_spans.pop(run_id)
+            
+            # Ollama's own durations, in nanoseconds, next to the span's wall time show how long the request queued behind others.
+            tracer.end_span(span, {
+                "server.address": response_metadata.get("endpoint") or span["attributes"].get("server.address"),
+                "gen_ai.usage.input_tokens": response_metadata.get("prompt_eval_count"),
+                "gen_ai.usage.output_tokens": response_metadata.get("eval_count"),
+                "ollama.load_duration": response_metadata.get("load_duration"),
+                "ollama.prompt_eval_duration": response_metadata.get("prompt_eval_duration"),
+                "ollama.eval_duration": response_metadata.get("eval_duration"),
+                "ollama.total_duration": response_metadata.get("total_duration"),
+            })
+        
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            if run_id in self.llm_spans:
+                tracer.end_span(self.llm_spans.pop(run_id), error=error)
+    
+    return TracingCallbackHandler()
+
+class InterviewEngine:
+    # Drives interviews on an asyncio event loop through the graph's async API. Sessions are only thread ids in the checkpointer, so a single
+    # process can run any number of them concurrently without a thread each. The graph must be compiled with an async capable checkpointer,
+    # see setup_checkpointer(asynchronous=True).
+    def __init__(self, app, trace_destination=None):
+        self.app = app
+        
+        # InterviewMetrics of the sessions whose metrics are being collected, by thread id.
+        self.metrics = {}
+        
+        # With a trace destination, every session is traced by an InterviewTracer until it has a verdict, see InterviewTracer.
+        self.trace_destination = trace_destination
+        self.tracers = {}
+        
+        # When every session last ran the graph, see evict_idle.
+        self.last_runs = {}
+    
+    def thread_config(self, thread_id):
+        config = {
+            "configurable": {
+                "thread_id": thread_id
+            }
+        }
+        
+        callback_sources = [self.metrics.get(thread_id), self.tracers.get(thread_id)]
+        
+        if any(callback_sources):
+            config["callbacks"] = [source.handler() for source in callback_sources if source]
+        
+        return config
+    
+    def run_config(self, thread_id, attributes=None):
+        # The config of a run of the graph, as opposed to a mere read of its state, which is the only thing that gets traced.
+        if self.trace_destination and thread_id not in self.tracers:
+            self.tracers[thread_id] = InterviewTracer(thread_id, self.trace_destination, attributes)
+        
+        self.last_runs[thread_id] = time.monotonic()
+        
+        return self.thread_config(thread_id)
+    
+    async def evict_idle(self, idle_time):
+        # Every answer leaves its score in the background until the judgement, so a session abandoned before its verdict would hold on to it for
+        # as long as the process lives. The background work of the sessions that haven't run the graph for idle_time seconds is dropped, and their
+        # traces are exported as they stand. A session that comes back picks up from its checkpoint, and the judgement scores the answers again.
+        # Returns the thread ids of the sessions evicted.
+        import asyncio
+        
+        now = time.monotonic()
+        
+        idle_thread_ids = [thread_id for thread_id, last_run in self.last_runs.items() if now - last_run > idle_time]
+        
+        for thread_id in idle_thread_ids:
+            del self.last_runs[thread_id]
+            
+            self.app.background_tasks.discard(thread_id)
+            
+            if thread_id in self.tracers:
+                await asyncio.to_thread(self.tracers.pop(thread_id).export)
+        
+        return idle_thread_ids
+    
+    async def finish_trace(self, thread_id, state):
+        import asyncio
+        
+        if state.get("result") and thread_id in self.tracers:
+            await asyncio.to_thread(self.tracers.pop(thread_id).export)
+    
+    @contextlib.contextmanager
+    def discarding_on_error(self, thread_id):
+        # Speculative questions, summaries and scores are started again by the next run of the graph if it still needs them. A failed or
+        # cancelled run would otherwise leave them behind, for as long as the process lives.
+        try:
+            yield
+        except BaseException:
+            self.app.background_tasks.discard(thread_id)
+            
+            raise
+    
+    async def start(self, thread_id, role, docs_content):
+        with self.discarding_on_error(thread_id):
+            state = await self.app.ainvoke(initial_state(role, docs_content), config=self.run_config(thread_id, {"interview.role": role}))
+        
+        await self.finish_trace(thread_id, state)
+        
+        return state
+    
+    async def answer(self, thread_id, answer):
+        from langgraph.types import Command
+        
+        with self.discarding_on_error(thread_id):
+            state = await self.app.ainvoke(Command(resume=answer), config=self.run_config(thread_id))
+        
+        await self.finish_trace(thread_id, state)
+        
+        return state
+    
+    async def state(self, thread_id):
+        snapshot = await self.app.aget_state(self.thread_config(thread_id))
+        
+        return snapshot.values
+    
+    async def close(self):
+        import asyncio
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        
+        self.app.background_tasks.clear()
+        
+        # Sessions still waiting for an answer are exported as they stand.
+        for thread_id in list(self.tracers):
+            await asyncio.to_thread(self.tracers.pop(thread_id).export)
+        
+        # The aiosqlite connection runs on its own thread, which would otherwise keep the process alive.
+        if isinstance(self.app.checkpointer, AsyncSqliteSaver):
+            await self.app.checkpointer.conn.close()
+    
+    async def stream_answer(self, thread_id, answer):
+        from langgraph.types import Command
+        
+        # Yields the next question's tokens as they are generated. The state after the answer is then available through state().
+        with self.discarding_on_error(thread_id):
+            async for chunk, metadata in self.app.astream(Command(resume=answer), config=self.run_config(thread_id), stream_mode="messages"):
+                if is_question_token(chunk, metadata):
+                    yield chunk.content
+        
+        if thread_id in self.tracers:
+            await self.finish_trace(thread_id, await self.state(thread_id))
 
-    for doc in loaded_docs:
-        docs_content += doc.page_content
+def load_uploaded_resume(upload, cache_dir):
+    # The loaders work on paths, and the extension picks the loader.
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(upload.filename)[1], delete=False) as file:
+        shutil.copyfileobj(upload.file, file)
     
-    return docs_content
+    try:
+        return setup_doc_loader(file.name, cache_dir)
+    finally:
+        os.remove(file.name)
 
-def setup_graph_nodes(llm, role, workflow, template_next_question, template_followup_question, template_judgement, max_questions, max_followups):
-    def ask_next_question(resume, history):
-        prompt = template_next_question.invoke({"role": role, "resume": resume, "history": history})
+def setup_server(engine, max_questions, model=DEFAULT_MODEL, base_urls=(), backend="ollama"):
+    import asyncio
+    from aiohttp import web, WSMsgType
+    
+    connection_errors = model_connection_errors(backend)
+    timeout_errors = model_timeout_errors(backend)
+    
+    unreachable_message = f"Failed to reach the language model. Make sure {describe_model_server(model, base_urls, backend)}."
+    timeout_message = "The language model took too long to answer, even after retrying."
+    
+    routes = web.RouteTableDef()
+    
+    # Answers to the same interview are applied one at a time, answers to different interviews run concurrently.
+    session_locks = collections.defaultdict(asyncio.Lock)
+    
+    def session_view(session_id, state):
+        if state["result"]:
+            return {"session_id": session_id, "done": True, "result": state["result"], "has_passed": state["has_passed"], "score": state["score"]}
+        
+        return {"session_id": session_id, "done": False, "question": state["question"], "index": get_question_index(state), "total": max_questions * (MAX_FOLLOWUPS + 1)}
+    
+    def error(status, message):
+        return web.json_response({"error": message}, status=status)
+    
+    def json_object(text):
+        # Request bodies and socket messages must be JSON objects. Anything else gives None.
+        try:
+            body = json.loads(text)
+        except ValueError:
+            return None
         
-        question = llm.invoke(prompt)
+        return body if isinstance(body, dict) else None
+    
+    async def load_session(session_id):
+        state = await engine.state(session_id)
         
-        return question.content
-
-    def handle_next_question(state):    
-        question = ask_next_question(state["context"], state["history"])
+        if not state:
+            raise web.HTTPNotFound(text=json.dumps({"error": f"There is no interview with the session id {session_id}."}), content_type="application/json")
         
-        return {
-            "question": question,
-            "total_questions": state["total_questions"] + 1,
-            "total_followups": 0,
-            "history": state["history"] + "\n" + "QUESTION: " + question,
-            "question_history": "QUESTION: " + question
-        }
-
-    def ask_followup_question(resume, history, question_history):
-        prompt = template_followup_question.invoke({"role": role, "resume": resume, "history": history, "question_history": question_history})
+        return state
+    
+    @web.middleware
+    async def model_errors(request, handler):
+        try:
+            return await handler(request)
+        except timeout_errors:
+            return error(504, timeout_message)
+        except connection_errors:
+            return error(503, unreachable_message)
+    
+    @routes.post("/sessions")
+    async def start_session(request):
+        if request.content_type == "multipart/form-data":
+            form = await request.post()
+            
+            role = form.get("role")
+            upload = form.get("resume")
+            
+            if not isinstance(upload, web.FileField) or not upload.filename.endswith((".pdf", ".docx")):
+                return error(400, "The resume file must be a PDF or DOCX file.")
+            
+            docs_content = await asyncio.to_thread(load_uploaded_resume, upload, RESUME_CACHE_DIR)
+        else:
+            body = json_object(await request.text())
+            
+            if body is None:
+                return error(400, "The request body must be a JSON object.")
+            
+            role = body.get("role")
+            docs_content = body.get("resume")
         
-        question = llm.invoke(prompt)
+        if not role or not docs_content:
+            return error(400, "Both the role and the resume are required.")
         
-        return question.content
-
-    def handle_followup_question(state):
-        question = ask_followup_question(state["context"], state["history"], state["question_history"])
+        if not isinstance(role, str) or not isinstance(docs_content, str):
+            return error(400, "The role and the resume must be text.")
         
-        return {
-            "question": question,
-            "total_followups": state["total_followups"] + 1,
-            "history": state["history"] + "\n" + "QUESTION: " + question,
-            "question_history": state["question_history"] + "\n" + "QUESTION: " + question
-        }
+        session_id = str(uuid.uuid4())
         
-    def human_answer_question(state):    
-        answer = interrupt(state["question"])
+        async with session_locks[session_id]:
+            state = await engine.start(session_id, role, docs_content)
         
-        return {
-            "history": state["history"] + "\n" + "ANSWER: " + answer,
-            "question_history": state["question_history"] + "\n" + "ANSWER: " + answer
-        }
+        return web.json_response(session_view(session_id, state), status=201)
+    
+    @routes.get("/sessions/{session_id}")
+    async def get_session(request):
+        session_id = request.match_info["session_id"]
+        
+        return web.json_response(session_view(session_id, await load_session(session_id)))
+    
+    @routes.post("/sessions/{session_id}/answer")
+    async def answer_question(request):
+        session_id = request.match_info["session_id"]
+        
+        body = json_object(await request.text())
         
-    def judge_candidate(state):
-        prompt = template_judgement.invoke({"role": role, "history": state["history"]})
+        if body is None:
+            return error(400, "The request body must be a JSON object.")
         
-        class Judgement(BaseModel):
-            has_passed: str = Field(description="Whether the candidate is recommended for the role. The possible values are 'yes' or 'no'.")
-            recommendation: str = Field(description="""
-                Provide a recommendation based on the candidate's answers.
-                Talk about competences such as technical knowledge, problem-solving skills, communication skills, initiative, adaptability, and teamwork.
-                You don't need to mention all of them, mention the ones that are suitable for the questions asked.
-            """) # https://www.reddit.com/r/LocalLLaMA/comments/1hcj0ur/structured_outputs_can_hurt_the_performance_of/
-            score: int = Field(description="The score of the candidate. 0 out of 100.")
+        if not body.get("answer") or not isinstance(body["answer"], str):
+            return error(400, "Please provide an answer.")
         
-        question = llm.with_structured_output(Judgement).invoke(prompt)
+        # Unknown session ids are turned away before a lock is made for them.
+        await load_session(session_id)
         
-        has_passed_bool = True if question.has_passed == "yes" else False
+        async with session_locks[session_id]:
+            if (await load_session(session_id))["result"]:
+                return error(409, "The interview is already over.")
+            
+            state = await engine.answer(session_id, body["answer"])
         
-        return {"result": question.recommendation, "has_passed": has_passed_bool, "score": int(question.score)}
+        return web.json_response(session_view(session_id, state))
     
-    def check_for_followup_or_judgement(state):
-        if state["total_questions"] ==  max_questions and state["total_followups"] == max_followups:
-            return "judge_candidate"
+    @routes.get("/sessions/{session_id}/result")
+    async def get_result(request):
+        session_id = request.match_info["session_id"]
         
-        elif state["total_followups"] < max_followups:
-            return "handle_followup_question"
+        state = await load_session(session_id)
         
-        else:
-            return "handle_next_question"
+        if not state["result"]:
+            return error(409, "The interview is not over yet.")
         
-    workflow.add_node("handle_next_question", handle_next_question)
-    workflow.add_node("handle_followup_question", handle_followup_question)
-    workflow.add_node("judge_candidate", judge_candidate)
-    workflow.add_node("human_answer_question", human_answer_question)
-
-    workflow.set_entry_point("handle_next_question")
-
-    workflow.add_edge("handle_next_question", "human_answer_question")
-    workflow.add_edge("handle_followup_question", "human_answer_question")
+        return web.json_response(session_view(session_id, state))
+    
+    @routes.get("/sessions/{session_id}/ws")
+    async def session_socket(request):
+        # Answers are sent as {"answer": ...}. The next question is streamed back as {"token": ...} messages, followed by the session itself.
+        session_id = request.match_info["session_id"]
+        
+        state = await load_session(session_id)
+        
+        socket = web.WebSocketResponse()
+        
+        await socket.prepare(request)
+        
+        await socket.send_json(session_view(session_id, state))
+        
+        async for message in socket:
+            if message.type != WSMsgType.TEXT:
+                continue
+            
+            body = json_object(message.data)
+            
+            if body is None:
+                await socket.send_json({"error": "Messages must be JSON objects."})
+                
+                continue
+            
+            answer = body.get("answer")
+            
+            if not answer or not isinstance(answer, str):
+                await socket.send_json({"error": "Please provide an answer."})
+                
+                continue
+            
+            async with session_locks[session_id]:
+                if (await engine.state(session_id))["result"]:
+                    await socket.send_json({"error": "The interview is already over."})
+                    
+                    break
+                
+                try:
+                    async for token in engine.stream_answer(session_id, answer):
+                        await socket.send_json({"token": token})
+                except timeout_errors:
+                    await socket.send_json({"error": timeout_message})
+                    
+                    break
+                except connection_errors:
+                    await socket.send_json({"error": unreachable_message})
+                    
+                    break
+                
+                state = await engine.state(session_id)
+            
+            await socket.send_json(session_view(session_id, state))
+            
+            if state["result"]:
+                break
+        
+        await socket.close()
+        
+        return socket
+    
+    async def evict_idle_sessions(server):
+        # Locks are only taken for the length of a request, so the ones not held can be dropped: a request about to take one takes it before
+        # this coroutine can run again.
+        async def evict():
+            while True:
+                await asyncio.sleep(SESSION_EVICTION_INTERVAL)
+                
+                await engine.evict_idle(SESSION_IDLE_TIME)
+                
+                for session_id in [session_id for session_id, lock in session_locks.items() if not lock.locked()]:
+                    del session_locks[session_id]
+        
+        eviction = asyncio.create_task(evict())
+        
+        yield
+        
+        eviction.cancel()
+    
+    async def close_engine(server):
+        await engine.close()
+    
+    server = web.Application(middlewares=[model_errors])
+    
+    server.add_routes(routes)
+    
+    server.cleanup_ctx.append(evict_idle_sessions)
+    server.on_cleanup.append(close_engine)
+    
+    return server
 
-    workflow.add_conditional_edges("human_answer_question", check_for_followup_or_judgement)    
+def read_answer_script(script_path):
+    # One answer per line, either as a JSON string or as an object with an "answer" key.
+    answers = []
+    
+    with open(script_path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            
+            answer = json.loads(line)
+            
+            answers.append(answer if isinstance(answer, str) else answer["answer"])
+    
+    return answers
 
-def setup_checkpointer(workflow):
-    checkpointer = MemorySaver()
+async def run_scripted_interview(engine, resume_path, script_path, role, semaphore):
+    import asyncio
+    
+    record = {"resume": os.path.basename(resume_path), "role": role, "questions": [], "timings": {"turns": []}}
+    
+    thread_id = None
+    
+    async with semaphore:
+        started_at = time.perf_counter()
+        
+        try:
+            answers = read_answer_script(script_path)
+            
+            docs_content = await asyncio.to_thread(setup_doc_loader, resume_path, RESUME_CACHE_DIR)
+            
+            record["timings"]["parse"] = time.perf_counter() - started_at
+            
+            thread_id = str(uuid.uuid4())
+            
+            engine.metrics[thread_id] = InterviewMetrics()
+            
+            turn_started_at = time.perf_counter()
+            
+            state = await engine.start(thread_id, role, docs_content)
+            
+            record["timings"]["first_question"] = time.perf_counter() - turn_started_at
+            
+            for answer in answers:
+                if state["result"]:
+                    break
+                
+                record["questions"].append({"question": state["question"], "answer": answer})
+                
+                turn_started_at = time.perf_counter()
+                
+                state = await engine.answer(thread_id, answer)
+                
+                record["timings"]["turns"].append(time.perf_counter() - turn_started_at)
+            
+            if not state["result"]:
+                raise ValueError(f"The answer script ran out after {len(answers)} answers.")
+            
+            record.update({"score": state["score"], "has_passed": state["has_passed"], "recommendation": state["result"], "error": None})
+        
+        except Exception as error:
+            record.update({"score": None, "has_passed": None, "recommendation": None, "error": f"{type(error).__name__}: {error}"})
+        
+        record["timings"]["total"] = time.perf_counter() - started_at
+        
+        if thread_id in engine.metrics:
+            record["metrics"] = engine.metrics.pop(thread_id).summary()
+    
+    return record
 
-    app = workflow.compile(checkpointer=checkpointer)
+async def run_batch(engine, sessions, role, concurrency, output):
+    import asyncio
     
-    return app
+    semaphore = asyncio.Semaphore(concurrency)
     
+    tasks = [run_scripted_interview(engine, resume_path, script_path, role, semaphore) for resume_path, script_path in sessions]
+    
+    records = []
+    
+    try:
+        # Records are written as sessions finish, so a long run can be followed, or salvaged, from the output file.
+        for task in asyncio.as_completed(tasks):
+            record = await task
+            
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            
+            records.append(record)
+    finally:
+        await engine.close()
+    
+    return records
+
 def introduce_interview(role):
     # https://patorjk.com/software/taag/#p=display&f=Slant&t=Smithers
     click.secho(r"""           
@@ -184,11 +2419,122 @@ def introduce_interview(role):
     
     click.clear()
 
-@click.command()
+def print_question_header(question_index, max_index):
+    click.secho(f"[{question_index}/{max_index}]: ", nl=False, fg="yellow")
+    click.secho("Question: ", nl=False, fg="yellow")
+
+def stream_question(app, graph_input, thread_config, spinner_message, question_index, max_index):
+    from halo import Halo
+    
+    # Tokens are printed as soon as the model emits them, so the wait is bound by the time to the first token instead of the full generation.
+    # https://langchain-ai.github.io/langgraph/how-tos/streaming-tokens/
+    spinner = Halo(text=spinner_message, spinner="dots")
+    
+    spinner.start()
+    
+    has_streamed = False
+    
+    try:
+        for chunk, metadata in app.stream(graph_input, config=thread_config, stream_mode="messages"):
+            if not is_question_token(chunk, metadata):
+                continue
+            
+            if not has_streamed:
+                spinner.stop()
+                
+                print_question_header(question_index, max_index)
+                
+                has_streamed = True
+            
+            click.secho(chunk.content, nl=False, fg="blue")
+    finally:
+        spinner.stop()
+    
+    if has_streamed:
+        click.echo()
+        
+        click.echo()
+    
+    return app.get_state(thread_config).values, has_streamed
+
+def parse_node_models(ctx, param, value):
+    # Turns the repeated NODE=MODEL values of --node-model into a mapping of nodes to models.
+    node_models = {}
+    
+    for node_model in value:
+        node, _, model = node_model.partition("=")
+        
+        if node not in MODEL_NODES or not model:
+            raise click.BadParameter(f"{node_model} is not NODE=MODEL with NODE one of {", ".join(MODEL_NODES)}.")
+        
+        node_models[node] = model
+    
+    return node_models
+
+def read_model_config(ctx, param, value):
+    # A TOML file mapping nodes to models in its models table:
+    #
+    #     [models]
+    #     handle_followup_question = "llama3.2:1b"
+    #     judge_candidate = "llama3.1:70b"
+    if not value:
+        return {}
+    
+    with open(value, "rb") as file:
+        try:
+            node_models = tomllib.load(file).get("models", {})
+        except tomllib.TOMLDecodeError as error:
+            raise click.BadParameter(f"{value} is not valid TOML: {error}")
+    
+    for node, model in node_models.items():
+        if node not in MODEL_NODES or not isinstance(model, str):
+            raise click.BadParameter(f"{node} = {model!r} in {value} is not a model name for one of {", ".join(MODEL_NODES)}.")
+    
+    return node_models
+
+class DefaultCommandGroup(click.Group):
+    # Smithers started out as a single command, so anything that is not the name of a subcommand is handed to the interview command and
+    # `smithers RESUME --role ROLE` keeps working.
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and args[0] not in ctx.help_option_names):
+            args.insert(0, "interview")
+        
+        return super().parse_args(ctx, args)
+
+@click.group(cls=DefaultCommandGroup)
+def cli():
+    """
+    An LLM-powered CLI that simulates job interviews based on your resume.\n
+    Without a command, the interview command is run.
+    """
+
+@cli.command()
 @click.argument("filename", type=click.Path(exists=True))
 @click.option("-r", "--role", help="Role the user is applying for in the interview", required=True)
 @click.option("-max", "--max_questions", help="Maximum number of questions to ask", default=1)
-def interview(filename, role, max_questions):
+@click.option("--stream", is_flag=True, help="Print each question token by token as the model writes it")
+@click.option("--speculate", is_flag=True, help="Write the next question about a new subject while the candidate is still answering")
+@click.option("--keep-alive", help="How long Ollama keeps the model and its prompt cache loaded between questions", default="30m", show_default=True)
+@click.option("--backend", type=click.Choice(MODEL_BACKENDS), help="Ollama, or a server with an OpenAI compatible API such as llama.cpp's server or vLLM", default="ollama", show_default=True)
+@click.option("--model", help="Name of the model on the model server", default=DEFAULT_MODEL, show_default=True)
+@click.option("--base-url", "base_urls", multiple=True, help=f"URL of the model server, repeat it to spread the interviews across several servers [default: Ollama's own, {DEFAULT_OPENAI_BASE_URL} for the openai backend]")
+@click.option("--timeout", type=float, help="Seconds a model call waits for the server before it fails", default=DEFAULT_MODEL_TIMEOUT, show_default=True)
+@click.option("--retries", help="Number of times a model call that failed for a transient reason is retried", default=DEFAULT_MODEL_RETRIES, show_default=True)
+@click.option("--fallback-model", help="Smaller model that takes the calls the model fails or answers too slowly")
+@click.option("--latency-slo", type=float, help="Seconds the model has to answer before the call goes to the --fallback-model", default=DEFAULT_LATENCY_SLO, show_default=True)
+@click.option("--node-model", "node_model_options", multiple=True, callback=parse_node_models, metavar="NODE=MODEL", help=f"Model of one of the nodes {", ".join(MODEL_NODES)} in place of --model, can be repeated")
+@click.option("--model-config", type=click.Path(exists=True, dir_okay=False), callback=read_model_config, help="TOML file whose models table maps nodes to their models, --node-model takes precedence")
+@click.option("--session-id", help="Save the interview under this id so it can be resumed later")
+@click.option("--resume", is_flag=True, help="Resume the interview saved under --session-id from its last question")
+@click.option("--checkpoint-db", type=click.Path(dir_okay=False), help=f"SQLite file where interviews are saved [default when --session-id is given: {DEFAULT_CHECKPOINT_DB}]")
+@click.option("--max-sessions", help="Number of most recent interviews kept in the checkpoint database", default=20, show_default=True)
+@click.option("--no-cache", is_flag=True, help="Parse the resume file again instead of using its cached text")
+@click.option("--workers", help="Number of processes extracting the pages of a PDF resume", default=1, show_default=True)
+@click.option("--max-pages", help="Only the first pages of a PDF resume up to this number are read", default=50, show_default=True)
+@click.option("--metrics", is_flag=True, help="Print the time and tokens spent by every node of the graph at the end of the interview")
+@click.option("--metrics-json", type=click.File("w"), help="JSON file the time and tokens spent by every node of the graph are written to")
+@click.option("--trace", help="File the OpenTelemetry trace of the interview is appended to as OTLP JSON, or the URL of an OTLP/HTTP endpoint it is posted to")
+def interview(filename, role, max_questions, stream, speculate, keep_alive, backend, model, base_urls, timeout, retries, fallback_model, latency_slo, node_model_options, model_config, session_id, resume, checkpoint_db, max_sessions, no_cache, workers, max_pages, metrics, metrics_json, trace):
     """
     This script will run an interview with a candidate based on the provided resume FILENAME.\n
     Only PDF and DOCX files are supported.
@@ -201,59 +2547,197 @@ def interview(filename, role, max_questions):
         
         return
     
-    llm = ChatOllama(model="llama3.1")
+    if resume and not session_id:
+        click.secho("The --resume flag requires the --session-id of the interview to resume.", fg="red")
+        
+        return
     
-    docs_content = setup_doc_loader(filename)
+    if session_id and not checkpoint_db:
+        checkpoint_db = DEFAULT_CHECKPOINT_DB
     
-    template_next_question, template_followup_question, template_judgement = setup_prompt_templates()
+    check_model_backend(backend)
     
-    workflow = setup_state()
+    connection_errors = model_connection_errors(backend)
+    timeout_errors = model_timeout_errors(backend)
     
-    setup_graph_nodes(llm, role, workflow, template_next_question, template_followup_question, template_judgement, max_questions, 1)
+    node_models = {**model_config, **node_model_options}
     
-    app = setup_checkpointer(workflow)
-
     thread_config = {
         "configurable": {
-            "thread_id": uuid.uuid4()
+            "thread_id": session_id or str(uuid.uuid4())
         }
     }
-
-    try:         
-        spinner = Halo(text="Loading the language model...", spinner="dots")
+    
+    interview_metrics = InterviewMetrics() if metrics or metrics_json else None
+    
+    tracer = InterviewTracer(thread_config["configurable"]["thread_id"], trace, {"interview.role": role}) if trace else None
+    
+    if interview_metrics or tracer:
+        thread_config["callbacks"] = [source.handler() for source in (interview_metrics, tracer) if source]
+    
+    # The model is loaded and the resume is parsed in the background while the candidate reads the welcome screen, so the first question is
+    # usually ready by the time they press a key.
+    # Its result is never read: if Ollama can't be reached, generating the first question fails the same way.
+    submit_in_daemon_thread(warm_up_models, keep_alive, [node_models.get("handle_next_question", model), model, *node_models.values()], base_urls, backend)
+    
+    preparation = None
+    
+    if resume:
+        llm, node_llms = setup_models(keep_alive, model, node_models, base_urls, backend, timeout, retries, fallback_model, latency_slo)
         
-        spinner.start()
+        app = setup_app(llm, max_questions, speculate, checkpoint_db, node_llms=node_llms)
         
-        interview = app.invoke({
-            "context": docs_content,
-            "total_questions": 0,
-            "total_followups": 0,
-            "history": "",
-            "question_history": "",
-            "result": "",
-            },
-            config=thread_config
-        )
+        # The resume is already part of the saved state, as is the question waiting for an answer.
+        snapshot = app.get_state(thread_config)
         
-        spinner.stop()
+        interview = snapshot.values
         
-    except ConnectError:
-        click.secho("Failed to load the language model. Make sure Ollama is running llama3.1 before trying out this script.", fg="red")
+        if not interview:
+            click.secho(f"There is no saved interview with the session id {session_id}.", fg="red")
+            
+            return
         
-        return
+        # An interview paused while the next question was being written is saved before the node writing it, and the question shown would be
+        # the one already answered. The question is written first.
+        if snapshot.next and snapshot.next != ("human_answer_question",):
+            preparation = submit_in_daemon_thread(lambda: (app, app.invoke(None, config=thread_config)))
+    else:
+        def prepare_interview():
+            docs_content = setup_doc_loader(filename, None if no_cache else RESUME_CACHE_DIR, workers, max_pages)
+            
+            llm, node_llms = setup_models(keep_alive, model, node_models, base_urls, backend, timeout, retries, fallback_model, latency_slo)
+            
+            app = setup_app(llm, max_questions, speculate, checkpoint_db, node_llms=node_llms)
+            
+            return app, app.invoke(initial_state(role, docs_content), config=thread_config)
+        
+        preparation = submit_in_daemon_thread(prepare_interview)
+    
+    paused_message = f"Interview paused. Run the same command with --session-id {thread_config["configurable"]["thread_id"]} --resume to continue."
     
-    introduce_interview(role)
+    try:
+        introduce_interview(role)
         
-    while not interview["result"]:
-        question_index = interview["total_questions"] * 1 + interview["total_followups"]
-        max_index = max_questions * 1 + max_questions
+        if preparation:
+            app, interview = wait_with_spinner(preparation, "Loading the language model...")
+    
+    except (KeyboardInterrupt, EOFError):
+        if not checkpoint_db:
+            raise
+        
+        click.echo()
+        
+        click.secho(paused_message, fg="yellow")
+        
+        return
+    except timeout_errors:
+        click.secho("The language model took too long to write the first question, even after retrying. Try again with a longer --timeout.", fg="red")
+        
+        return
+    except connection_errors:
+        click.secho(f"Failed to load the language model. Make sure {describe_model_server(model, base_urls, backend)} before trying out this script.", fg="red")
+        
+        return
+    
+    try:
+        run_interview(app, interview, thread_config, max_questions, stream)
+    
+    except timeout_errors + connection_errors as model_error:
+        click.echo()
         
-        click.secho(f"[{question_index}/{max_index}]: ", nl=False, fg="yellow")
-        click.secho("Question: ", nl=False, fg="yellow")
-        click.secho(interview["question"], fg="blue")
+        click.secho(f"The language model failed to answer, even after retrying: {model_error}", fg="red")
+    
+    except (KeyboardInterrupt, EOFError):
+        if not checkpoint_db:
+            raise
         
         click.echo()
         
+        click.secho(paused_message, fg="yellow")
+    
+    finally:
+        if checkpoint_db:
+            prune_checkpoints(checkpoint_db, max_sessions)
+        
+        if metrics:
+            click.echo()
+            
+            print_metrics(interview_metrics)
+        
+        if metrics_json:
+            json.dump(interview_metrics.summary(), metrics_json, indent=2)
+        
+        if tracer:
+            tracer.export()
+
+def warm_up_models(keep_alive, models=(DEFAULT_MODEL,), base_urls=(), backend="ollama"):
+    # llama.cpp's server and vLLM load their model when they start.
+    if backend != "ollama":
+        return
+    
+    # A request without a prompt only loads the model, and keep_alive keeps it loaded until the first question comes. It is loaded with the
+    # context window every ContextBudget starts with, since Ollama would load it again for the first question otherwise.
+    # https://github.com/ollama/ollama/blob/main/docs/faq.md#how-can-i-preload-a-model-into-ollama-to-get-faster-response-times
+    from httpx import ConnectError
+    from ollama import Client
+    
+    # Any of the servers may get the first question, and one that is down is the router's business. The model of the first question is loaded
+    # first, and every model is only loaded once.
+    for model, base_url in itertools.product(dict.fromkeys(models), base_urls or (None,)):
+        try:
+            Client(host=base_url).generate(model=model, keep_alive=keep_alive, options={"num_ctx": CONTEXT_WINDOWS[0]})
+        except (ConnectError, ConnectionError):
+            if len(base_urls) <= 1:
+                raise
+
+def submit_in_daemon_thread(function, *args):
+    # Executor.submit on a thread of its own. The interpreter doesn't wait for a daemon thread at exit, so quitting while the model is loaded
+    # or the first question is written doesn't wait for them.
+    from concurrent.futures import Future
+    
+    future = Future()
+    
+    def run():
+        try:
+            future.set_result(function(*args))
+        except BaseException as error:
+            future.set_exception(error)
+    
+    threading.Thread(target=run, name="smithers", daemon=True).start()
+    
+    return future
+
+def wait_with_spinner(future, text):
+    if future.done():
+        return future.result()
+    
+    from halo import Halo
+    
+    spinner = Halo(text=text, spinner="dots")
+    
+    spinner.start()
+    
+    try:
+        return future.result()
+    finally:
+        spinner.stop()
+
+def run_interview(app, interview, thread_config, max_questions, stream):
+    from halo import Halo
+    from langgraph.types import Command
+    
+    has_streamed = False
+        
+    while not interview["result"]:
+        question_index = get_question_index(interview)
+        max_index = max_questions * (MAX_FOLLOWUPS + 1)
+        
+        if not has_streamed:
+            print_question_header(question_index, max_index)
+            click.secho(interview["question"], fg="blue")
+            
+            click.echo()
+        
         answer = ""
         
         while not answer:
@@ -272,16 +2756,25 @@ def interview(filename, role, max_questions):
         else:
             spinner_message = "Smithers is evaluating your answers..."
             
+        if stream and question_index != max_index:
+            # Whatever the next node is, it asks the question right after the current one.
+            interview, has_streamed = stream_question(app, Command(resume=answer), thread_config, spinner_message, question_index + 1, max_index)
+            
+            continue
+        
+        has_streamed = False
+            
         spinner = Halo(text=spinner_message, spinner="dots")
         
         spinner.start()
         
-        interview = app.invoke(
-            Command(resume=answer),
-            config=thread_config
-        )
-        
-        spinner.stop()
+        try:
+            interview = app.invoke(
+                Command(resume=answer),
+                config=thread_config
+            )
+        finally:
+            spinner.stop()
                 
     click.secho(interview["result"], fg="green" if interview["has_passed"] else "red")
         
@@ -296,7 +2789,114 @@ def interview(filename, role, max_questions):
             return "red"
     
     click.secho(f"SCORE: {interview["score"]}/100", fg=score_color(interview["score"], interview["has_passed"]))
-       
+
+@cli.command()
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("-r", "--role", help="Role the candidates are applying for in the interviews", required=True)
+@click.option("-max", "--max_questions", help="Maximum number of questions to ask", default=1)
+@click.option("-o", "--output", type=click.File("w"), help="JSONL file the results are written to", default="-", show_default=True)
+@click.option("-c", "--concurrency", help="Number of interviews run at the same time", default=8, show_default=True)
+@click.option("--speculate", is_flag=True, help="Write the next question about a new subject while the answer is being submitted")
+@click.option("--keep-alive", help="How long Ollama keeps the model and its prompt cache loaded between questions", default="30m", show_default=True)
+@click.option("--backend", type=click.Choice(MODEL_BACKENDS), help="Ollama, or a server with an OpenAI compatible API such as llama.cpp's server or vLLM", default="ollama", show_default=True)
+@click.option("--model", help="Name of the model on the model server", default=DEFAULT_MODEL, show_default=True)
+@click.option("--base-url", "base_urls", multiple=True, help=f"URL of the model server, repeat it to spread the interviews across several servers [default: Ollama's own, {DEFAULT_OPENAI_BASE_URL} for the openai backend]")
+@click.option("--timeout", type=float, help="Seconds a model call waits for the server before it fails", default=DEFAULT_MODEL_TIMEOUT, show_default=True)
+@click.option("--retries", help="Number of times a model call that failed for a transient reason is retried", default=DEFAULT_MODEL_RETRIES, show_default=True)
+@click.option("--fallback-model", help="Smaller model that takes the calls the model fails or answers too slowly")
+@click.option("--latency-slo", type=float, help="Seconds the model has to answer before the call goes to the --fallback-model", default=DEFAULT_LATENCY_SLO, show_default=True)
+@click.option("--node-model", "node_model_options", multiple=True, callback=parse_node_models, metavar="NODE=MODEL", help=f"Model of one of the nodes {", ".join(MODEL_NODES)} in place of --model, can be repeated")
+@click.option("--model-config", type=click.Path(exists=True, dir_okay=False), callback=read_model_config, help="TOML file whose models table maps nodes to their models, --node-model takes precedence")
+@click.option("--trace", help="File the OpenTelemetry traces of the interviews are appended to as OTLP JSON, or the URL of an OTLP/HTTP endpoint they are posted to")
+def batch(directory, role, max_questions, output, concurrency, speculate, keep_alive, backend, model, base_urls, timeout, retries, fallback_model, latency_slo, node_model_options, model_config, trace):
+    """
+    Run an interview for every resume in DIRECTORY without anyone at the keyboard.\n
+    Every PDF or DOCX resume needs an answer script next to it with the same name and a .jsonl extension, holding one answer per line, either
+    as a JSON string or as an object with an "answer" key. One JSON line is written per interview with the score, whether the candidate passed,
+    the recommendation, the timings in seconds and the time and tokens spent by every node of the graph.
+    """
+    import asyncio
+    
+    sessions = []
+    
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".pdf") or filename.endswith(".docx"):
+            script_path = os.path.join(directory, os.path.splitext(filename)[0] + ".jsonl")
+            
+            if os.path.exists(script_path):
+                sessions.append((os.path.join(directory, filename), script_path))
+            else:
+                click.secho(f"Skipping {filename}, it has no answer script.", fg="yellow", err=True)
+    
+    if not sessions:
+        click.secho("There are no resumes with an answer script in the directory.", fg="red", err=True)
+        
+        return
+    
+    check_model_backend(backend)
+    
+    llm, node_llms = setup_models(keep_alive, model, {**model_config, **node_model_options}, base_urls, backend, timeout, retries, fallback_model, latency_slo)
+    
+    app = setup_app(llm, max_questions, speculate, asynchronous=True, node_llms=node_llms)
+    
+    started_at = time.perf_counter()
+    
+    records = asyncio.run(run_batch(InterviewEngine(app, trace), sessions, role, concurrency, output))
+    
+    scores = [record["score"] for record in records if record["error"] is None]
+    
+    click.secho(f"{len(scores)}/{len(records)} interviews completed in {time.perf_counter() - started_at:.1f}s.", fg="green" if len(scores) == len(records) else "yellow", err=True)
+    
+    if scores:
+        click.secho(f"Average score: {sum(scores) / len(scores):.1f}/100", err=True)
+
+@cli.command()
+@click.option("--host", help="Interface the server listens on", default="127.0.0.1", show_default=True)
+@click.option("--port", help="Port the server listens on", default=8000, show_default=True)
+@click.option("-max", "--max_questions", help="Maximum number of questions to ask", default=1)
+@click.option("--speculate", is_flag=True, help="Write the next question about a new subject while the candidate is still answering")
+@click.option("--keep-alive", help="How long Ollama keeps the model and its prompt cache loaded between questions", default="30m", show_default=True)
+@click.option("--backend", type=click.Choice(MODEL_BACKENDS), help="Ollama, or a server with an OpenAI compatible API such as llama.cpp's server or vLLM", default="ollama", show_default=True)
+@click.option("--model", help="Name of the model on the model server", default=DEFAULT_MODEL, show_default=True)
+@click.option("--base-url", "base_urls", multiple=True, help=f"URL of the model server, repeat it to spread the interviews across several servers [default: Ollama's own, {DEFAULT_OPENAI_BASE_URL} for the openai backend]")
+@click.option("--timeout", type=float, help="Seconds a model call waits for the server before it fails", default=DEFAULT_MODEL_TIMEOUT, show_default=True)
+@click.option("--retries", help="Number of times a model call that failed for a transient reason is retried", default=DEFAULT_MODEL_RETRIES, show_default=True)
+@click.option("--fallback-model", help="Smaller model that takes the calls the model fails or answers too slowly")
+@click.option("--latency-slo", type=float, help="Seconds the model has to answer before the call goes to the --fallback-model", default=DEFAULT_LATENCY_SLO, show_default=True)
+@click.option("--node-model", "node_model_options", multiple=True, callback=parse_node_models, metavar="NODE=MODEL", help=f"Model of one of the nodes {", ".join(MODEL_NODES)} in place of --model, can be repeated")
+@click.option("--model-config", type=click.Path(exists=True, dir_okay=False), callback=read_model_config, help="TOML file whose models table maps nodes to their models, --node-model takes precedence")
+@click.option("--checkpoint-db", type=click.Path(dir_okay=False), help="SQLite file where interviews are saved, so they survive a restart of the server")
+@click.option("--max-sessions", help="Number of most recent interviews kept in the checkpoint database when the server stops", default=1000, show_default=True)
+@click.option("--trace", help="File the OpenTelemetry trace of every interview is appended to as OTLP JSON once it has a verdict, or the URL of an OTLP/HTTP endpoint it is posted to")
+def serve(host, port, max_questions, speculate, keep_alive, backend, model, base_urls, timeout, retries, fallback_model, latency_slo, node_model_options, model_config, checkpoint_db, max_sessions, trace):
+    """
+    Serve interviews over HTTP and WebSocket.\n
+    POST /sessions starts an interview from a JSON body with the role and the resume text, or from a multipart form with the role and a resume
+    file. Answers go to POST /sessions/{id}/answer, or are streamed through the /sessions/{id}/ws WebSocket, and the verdict is at
+    GET /sessions/{id}/result. All interviews are multiplexed on a single event loop.
+    """
+    from aiohttp import web
+    
+    check_model_backend(backend)
+    
+    llm, node_llms = setup_models(keep_alive, model, {**model_config, **node_model_options}, base_urls, backend, timeout, retries, fallback_model, latency_slo)
+    
+    # AsyncSqliteSaver binds to the running event loop, so the graph is only compiled once run_app has started it.
+    async def setup_server_app():
+        app = setup_app(llm, max_questions, speculate, checkpoint_db, asynchronous=True, node_llms=node_llms)
+        
+        server = setup_server(InterviewEngine(app, trace), max_questions, model, base_urls, backend)
+        
+        # Runs after the engine has closed its connection to the database.
+        async def prune_sessions(server):
+            prune_checkpoints(checkpoint_db, max_sessions)
+        
+        if checkpoint_db:
+            server.on_cleanup.append(prune_sessions)
+        
+        return server
+    
+    web.run_app(setup_server_app(), host=host, port=port)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,42 @@
+import unittest
+
+import smithers
+
+class SegmentResumeTest(unittest.TestCase):
+    def test_name_in_capitals_is_not_a_section(self):
+        # The name and contact details at the top must not become the first entry, which would be the first subject of the interview.
+        entries = smithers.segment_resume("\n".join([
+            "JOHN DOE",
+            "john@doe.com | +1 555 0100",
+            "",
+            "EXPERIENCE",
+            "Senior engineer at Acme, 2020-2024",
+            "- Rewrote the billing service in Go and cut its p99 latency by half",
+        ]))
+
+        self.assertEqual(len(entries), 1)
+        self.assertTrue(entries[0].startswith("EXPERIENCE\n"))
+        self.assertNotIn("john@doe.com", entries[0])
+
+    def test_heading_in_capitals_after_a_known_section(self):
+        entries = smithers.segment_resume("\n".join([
+            "EXPERIENCE",
+            "Senior engineer at Acme, 2020-2024, rewriting the billing service in Go",
+            "",
+            "OPEN SOURCE",
+            "Maintainer of a Python library for parsing resumes, with 2k stars on GitHub",
+        ]))
+
+        self.assertEqual([entry.splitlines()[0] for entry in entries], ["EXPERIENCE", "OPEN SOURCE"])
+
+    def test_company_name_in_capitals_is_not_a_section(self):
+        entries = smithers.segment_resume("\n".join([
+            "EXPERIENCE",
+            "ACME, INC.",
+            "Senior engineer, 2020-2024, rewriting the billing service in Go",
+        ]))
+
+        self.assertEqual(entries, ["EXPERIENCE\nACME, INC.\nSenior engineer, 2020-2024, rewriting the billing service in Go"])
+
+if __name__ == "__main__":
+    unittest.main()